@@ -0,0 +1,145 @@
+import timeit
+import random
+from three_way_epistasis import get_next_ordering, ordering_to_fitness, epi_positives_get, epi_negatives_get, \
+    EpistasisChecker
+from circuit_epistasis import get_positives_list, get_negatives_list, get_repetitions_from_circuit_number
+from models_HIV_2007 import ranking_probabilities, epistasis_from_values
+
+__author__ = "@gavruskin"
+
+
+# Microbenchmarks comparing the engines of the package with the implementations they replaced.
+# The replaced implementations are kept below (with the _reference suffix) to check that the results coincide.
+# Example of usage:
+# python -c "from benchmarks import benchmark_epistasis_check; benchmark_epistasis_check()"
+
+
+# The sign test as it was before EpistasisChecker: one list of ranks is rebuilt for every i.
+def epistasis_signs_reference(w, positives, negatives, repetitions):
+    positive = True
+    negative = True
+    for i in range(len(positives)):
+        if not epi_positives_get(i, w, positives, repetitions) <= epi_negatives_get(i, w, negatives, repetitions):
+            positive = False
+            break
+    for i in range(len(positives)):
+        if not epi_positives_get(i, w, positives, repetitions) >= epi_negatives_get(i, w, negatives, repetitions):
+            negative = False
+            break
+    return [positive, negative]
+
+
+# Returns the list of all 8! rankings in the order of get_next_ordering.
+def get_all_rankings_reference():
+    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
+    output = [ordering_to_fitness(ordering)]
+    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
+        ordering = get_next_ordering(ordering)
+        output.append(ordering_to_fitness(ordering))
+    return output
+
+
+# Checks that EpistasisChecker agrees with the reference sign test on all rankings and all 24 circuits, and prints
+# the time per ranking of both implementations.
+def benchmark_epistasis_check(number_rankings=2000):
+    rankings = get_all_rankings_reference()
+    positives_list = get_positives_list()
+    negatives_list = get_negatives_list()
+    for circuit_number in range(24):
+        positives = positives_list[circuit_number]
+        negatives = negatives_list[circuit_number]
+        repetitions = get_repetitions_from_circuit_number(circuit_number + 1)
+        checker = EpistasisChecker(positives, negatives, repetitions)
+        for w in rankings:
+            if checker.check(w) != epistasis_signs_reference(w, positives, negatives, repetitions):
+                print("EpistasisChecker disagrees with the reference on circuit %s and ranking %s."
+                      % (circuit_number + 1, w))
+                return
+    print("EpistasisChecker agrees with the reference on all %s rankings and 24 circuits." % len(rankings))
+
+    sample = rankings[:number_rankings]
+    positives = {1, 5, 6, 7}
+    negatives = {4, 3, 2, 8}
+    repetitions = [1, 1, 1, 1, 1, 1, 1, 1]
+    checker = EpistasisChecker(positives, negatives, repetitions)
+    reference_time = min(timeit.repeat(
+        lambda: [epistasis_signs_reference(w, positives, negatives, repetitions) for w in sample],
+        number=1, repeat=3)) / len(sample)
+    checker_time = min(timeit.repeat(lambda: [checker.check(w) for w in sample], number=1, repeat=3)) / len(sample)
+    print("Reference sign test: %s microseconds per ranking" % round(10 ** 6 * reference_time, 3))
+    print("EpistasisChecker: %s microseconds per ranking" % round(10 ** 6 * checker_time, 3))
+    print("Speedup: %sx" % round(reference_time / checker_time, 1))
+
+
+# ranking_probabilities as it was before sorting: all pairs of trials are compared in quadruple nested loops.
+def ranking_probabilities_reference(fit_data_list):
+    output = [[0] * len(fit_data_list) for _ in fit_data_list]
+    for j in range(len(fit_data_list)):
+        for i in range(len(fit_data_list)):
+            if i != j:
+                probability_j = 1 / float(len(fit_data_list[j]))
+                count = 0
+                for x in range(len(fit_data_list[j])):
+                    for r in range(len(fit_data_list[i])):
+                        if fit_data_list[i][r] < fit_data_list[j][x]:
+                            count += 1
+                probability_i = count / float(len(fit_data_list[i]))
+                output[i][j] = probability_j * probability_i
+    return output
+
+
+# Checks that ranking_probabilities agrees with the reference and prints the running times of both.
+# fit_data_list is the list of trial lists, e.g. datafile_hiv_process() for the HIV data. By default, number_genotypes
+# genotypes with number_trials random trials each are used, rounded to produce ties.
+def benchmark_ranking_probabilities(fit_data_list=None, number_genotypes=8, number_trials=200):
+    if fit_data_list is None:
+        fit_data_list = [[round(random.uniform(0, 1), 2) for _ in range(number_trials)]
+                         for _ in range(number_genotypes)]
+    output = ranking_probabilities(fit_data_list)
+    reference = ranking_probabilities_reference(fit_data_list)
+    if output != reference:
+        print("ranking_probabilities disagrees with the reference.")
+        return
+    print("ranking_probabilities agrees with the reference on %s genotypes and %s trials."
+          % (len(fit_data_list), sum([len(trials) for trials in fit_data_list])))
+    reference_time = min(timeit.repeat(lambda: ranking_probabilities_reference(fit_data_list), number=1, repeat=3))
+    sorting_time = min(timeit.repeat(lambda: ranking_probabilities(fit_data_list), number=1, repeat=3))
+    print("Reference ranking_probabilities: %s milliseconds" % round(10 ** 3 * reference_time, 3))
+    print("Sorting ranking_probabilities: %s milliseconds" % round(10 ** 3 * sorting_time, 3))
+    print("Speedup: %sx" % round(reference_time / sorting_time, 1))
+
+
+# epistasis_from_values as it was before meet in the middle: all combinations of one trial per genotype are looped
+# through.
+def epistasis_from_values_reference(fit_data_list):
+    epi_pos = epi_neg = total_count = 0
+    for w0 in fit_data_list[0]:
+        for w1 in fit_data_list[1]:
+            for w2 in fit_data_list[2]:
+                for w3 in fit_data_list[3]:
+                    for w4 in fit_data_list[4]:
+                        for w5 in fit_data_list[5]:
+                            for w6 in fit_data_list[6]:
+                                for w7 in fit_data_list[7]:
+                                    total_count += 1
+                                    e = (w0 + w4 + w5 + w6) - (w1 + w2 + w3 + w7)
+                                    if e > 0:
+                                        epi_pos += 1
+                                    elif e < 0:
+                                        epi_neg += 1
+    return [epi_pos / float(total_count), epi_neg / float(total_count), epi_pos, epi_neg, total_count]
+
+
+# Checks that epistasis_from_values agrees with the reference on number_trials random trials (rounded to produce ties)
+# per genotype and prints the running times of both.
+def benchmark_epistasis_from_values(number_trials=5):
+    fit_data_list = [[round(random.uniform(0, 1), 1) for _ in range(number_trials)] for _ in range(8)]
+    if epistasis_from_values(fit_data_list) != epistasis_from_values_reference(fit_data_list):
+        print("epistasis_from_values disagrees with the reference.")
+        return
+    print("epistasis_from_values agrees with the reference on %s trials per genotype." % number_trials)
+    reference_time = min(timeit.repeat(lambda: epistasis_from_values_reference(fit_data_list), number=1, repeat=3))
+    sorting_time = min(timeit.repeat(lambda: epistasis_from_values(fit_data_list), number=1, repeat=3))
+    print("Reference epistasis_from_values: %s milliseconds" % round(10 ** 3 * reference_time, 3))
+    print("Meet in the middle epistasis_from_values: %s milliseconds" % round(10 ** 3 * sorting_time, 3))
+    print("Speedup: %sx" % round(reference_time / sorting_time, 1))
@@ -0,0 +1,94 @@
+import os.path
+import sys
+import multiprocessing
+import numpy as np
+from three_way_epistasis import EpistasisChecker
+from circuit_epistasis import get_positives_list, get_negatives_list, get_repetitions_from_circuit_number
+from models_wilcoxon import rank_sum_3_sites
+from partial_order_interaction import get_circuit_formula, get_circuit_name
+
+__author__ = "@gavruskin"
+
+
+# Bootstrap of the circuit analysis of data_HIV_2007_circuit_analysis: the replicates of every genotype are resampled
+# with replacement, the rank order is re-derived by rank_sum_3_sites, and the signs of the 24 circuits (20 circuits and
+# 4 interaction coordinates, as in get_positives_list) implied by the rank order are tallied.
+# The samples are split into chunks, each with its own seed spawned from one SeedSequence, so that the counts depend on
+# the seed and the chunk size only, and not on the number of processes.
+# Example of usage:
+# counts = bootstrap_circuit_signs(datafile_hiv_process(), 10000, seed=1)
+# write_bootstrap_circuit_analysis(counts)
+
+
+# Returns the (24, 3) array of counts of [positive, negative, no interaction] for every circuit over number_samples
+# bootstrap samples of fit_data_list (the list of replicate lists of the eight genotypes) drawn with the seed seed.
+def bootstrap_chunk(fit_data_list, number_samples, seed):
+    rng = np.random.default_rng(seed)
+    fit_data_list = [np.asarray(trials, dtype=float) for trials in fit_data_list]
+    positives_list = get_positives_list()
+    negatives_list = get_negatives_list()
+    checkers = [EpistasisChecker(positives_list[c], negatives_list[c], get_repetitions_from_circuit_number(c + 1))
+                for c in range(len(positives_list))]
+    resamples = [trials[rng.integers(0, len(trials), (number_samples, len(trials)))] for trials in fit_data_list]
+    counts = np.zeros((len(checkers), 3), dtype=np.int64)
+    for sample in range(number_samples):
+        ranking = rank_sum_3_sites([resample[sample] for resample in resamples])
+        for c in range(len(checkers)):
+            epi_pos, epi_neg = checkers[c].check(ranking)
+            if epi_pos:
+                counts[c, 0] += 1
+            elif epi_neg:
+                counts[c, 1] += 1
+            else:
+                counts[c, 2] += 1
+    return counts
+
+
+# The same as bootstrap_chunk with the arguments in one list, for the pool.
+def bootstrap_task(arguments):
+    return bootstrap_chunk(*arguments)
+
+
+# Returns the (24, 3) array of counts of [positive, negative, no interaction] for every circuit over number_samples
+# bootstrap samples of fit_data_list (e.g. datafile_hiv_process()), run on number_processes processes (all cores if
+# None, no pool if 1) in chunks of chunk_size samples.
+def bootstrap_circuit_signs(fit_data_list, number_samples=1000, seed=None, number_processes=None, chunk_size=100):
+    number_chunks = (number_samples + chunk_size - 1) // chunk_size
+    seeds = np.random.SeedSequence(seed).spawn(number_chunks)
+    tasks = [[fit_data_list, min(chunk_size, number_samples - chunk * chunk_size), seeds[chunk]]
+             for chunk in range(number_chunks)]
+    counts = np.zeros((len(get_positives_list()), 3), dtype=np.int64)
+    if number_processes == 1:
+        for task in tasks:
+            counts += bootstrap_task(task)
+        return counts
+    with multiprocessing.Pool(number_processes) as pool:
+        for chunk_counts in pool.imap_unordered(bootstrap_task, tasks):
+            counts += chunk_counts
+    return counts
+
+
+# Writes the frequencies of the signs in counts (as returned by bootstrap_circuit_signs) into ./outputs/file_name.
+def write_bootstrap_circuit_analysis(counts, file_name="bootstrap_analysis_for_all_circuits.md"):
+    if os.path.isfile("./outputs/%s" % file_name):
+        print("\nFile %s already exists in directory 'outputs'. Please remove and rerun." % file_name)
+        sys.exit()
+    positives_list = get_positives_list()
+    negatives_list = get_negatives_list()
+    output_file = open("./outputs/%s" % file_name, "w")
+    output_file.write("This file has been created using software package Fitlands "
+                      "(Alex Gavryushkin, CBG, D-BSSE, ETH Zurich).\n"
+                      "Please refer to [https://github.com/gavruskin/fitlands] for legal matters, "
+                      "to obtain up-to-date bibliographic information for Fitlands, "
+                      "and to stay tuned.\n"
+                      "If you publish the results obtained with the help of this software, "
+                      "please don't forget to cite us.\n")
+    output_file.write("\n\n# Bootstrap analysis of interaction coordinates and circuit interactions\n\n"
+                      "Number of bootstrap samples: %s\n\n"
+                      "Circuit | + | - | +/-\n"
+                      "--- | --- | --- | ---\n" % int(np.sum(counts[0])))
+    for c in range(len(counts)):
+        circuit = get_circuit_formula(positives_list[c], negatives_list[c], get_repetitions_from_circuit_number(c + 1))
+        percents = [round(100 * count / float(np.sum(counts[c])), 2) for count in counts[c]]
+        output_file.write("{0} = {1} | {2}% | {3}% | {4}%\n".format(get_circuit_name(circuit), circuit, *percents))
+    output_file.close()
@@ -1,4 +1,7 @@
-from three_way_epistasis import list_epistasis, list_epistasis_signed, get_next_ordering, ordering_to_fitness
+import os.path
+import numpy
+from three_way_epistasis import list_epistasis, list_epistasis_signed
+from permutation_table import get_all_rankings, ranking_to_rank, epistasis_masks
 
 __author__ = "@gavruskin"
 
@@ -141,57 +144,86 @@ def shared_orders(file1, file2):
     shared_file.close()
 
 
+# Returns the (8!, 24) int8 matrix of signs of circuit interaction implied by all rankings:
+# the entry in row r and column c is 1 if the ranking with rank r (see permutation_table) implies positive interaction
+# for circuit number c + 1 (as in get_positives_list), -1 if it implies negative interaction, and 0 otherwise.
+def get_circuit_sign_index():
+    positives_list = get_positives_list()
+    negatives_list = get_negatives_list()
+    rankings = get_all_rankings(8)
+    index = numpy.zeros((len(rankings), len(positives_list)), dtype=numpy.int8)
+    for circuit_number in range(len(positives_list)):
+        repetitions = get_repetitions_from_circuit_number(circuit_number + 1)
+        epi_pos, epi_neg = epistasis_masks(rankings, positives_list[circuit_number], negatives_list[circuit_number],
+                                           repetitions)
+        index[epi_neg, circuit_number] = -1
+        index[epi_pos, circuit_number] = 1
+    return index
+
+
+# Writes the matrix returned by get_circuit_sign_index into ./outputs/file_name in the NumPy binary format.
+def write_circuit_sign_index(file_name="circuit_sign_index.npy"):
+    numpy.save("./outputs/%s" % file_name, get_circuit_sign_index())
+
+
+# Returns the matrix of get_circuit_sign_index from ./outputs/file_name, memory-mapped (read-only) if mmap == True.
+# The file is created first if it does not exist.
+def load_circuit_sign_index(file_name="circuit_sign_index.npy", mmap=True):
+    if not os.path.isfile("./outputs/%s" % file_name):
+        write_circuit_sign_index(file_name)
+    if mmap:
+        return numpy.load("./outputs/%s" % file_name, mmap_mode="r")
+    return numpy.load("./outputs/%s" % file_name)
+
+
+# Returns the list of circuit numbers for which ranking w implies interaction, each with the sign of the interaction,
+# e.g. [1, -2, 8] means positive interaction for circuits 1 and 8 and negative for circuit 2.
+# index is the matrix returned by get_circuit_sign_index or load_circuit_sign_index (loaded if None).
+def circuits_for_ranking(w, index=None):
+    if index is None:
+        index = load_circuit_sign_index()
+    signs = index[ranking_to_rank(w)]
+    return [int(signs[c]) * (c + 1) for c in range(len(signs)) if signs[c] != 0]
+
+
 # Generates a big file with the list of all rankings.
 # A ranking is followed by a list of circuits that imply epistasis.
-def circuits_to_orders():
+# Derived in one pass from the circuit sign index (see load_circuit_sign_index).
+def circuits_to_orders(index=None):
+    if index is None:
+        index = load_circuit_sign_index()
+    rankings = get_all_rankings(8).tolist()
+    lines = []
+    for rank in range(len(rankings)):
+        circuits = numpy.flatnonzero(index[rank, :20]) + 1
+        if rank == 0:
+            lines.append(str(rankings[rank]) + "\n" + "".join([str(circuit) for circuit in circuits]))
+        else:
+            lines.append("\n" + str(rankings[rank]) + "\n" + "".join([str(circuit) + " " for circuit in circuits]))
     circuits_to_orders_file = open("./outputs/circuits_to_orders.txt", "w")
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = [1, 2, 3, 4, 5, 6, 7, 8]
-    line = str(fitness) + "\n"
-    circuits_to_orders_file.write(line)
-    for circuit in range(1, 21):
-        if line in open("./outputs/circuit_%s_orders.txt" % circuit, "r"):
-            circuits_to_orders_file.write(str(circuit))
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        line = str(fitness) + "\n"
-        circuits_to_orders_file.write("\n" + line)
-        for circuit in range(1, 21):
-            if line in open("./outputs/circuit_%s_orders.txt" % circuit, "r"):
-                circuits_to_orders_file.write(str(circuit) + " ")
+    circuits_to_orders_file.write("".join(lines))
     circuits_to_orders_file.close()
 
 
 # Generates a big file with the list of all rankings.
 # A ranking is followed by a list of circuits with signs that imply epistasis.
-def circuits_to_orders_signed():
+# Derived in one pass from the circuit sign index (see load_circuit_sign_index).
+def circuits_to_orders_signed(index=None):
+    if index is None:
+        index = load_circuit_sign_index()
+    rankings = get_all_rankings(8).tolist()
+    signs = numpy.asarray(index[:, :20])
+    lines = []
+    for rank in range(len(rankings)):
+        if rank > 0:
+            lines.append("\n")
+        lines.append(str(rankings[rank]) + "\n")
+        for circuit in numpy.flatnonzero(signs[rank]):
+            lines.append(("+" if signs[rank, circuit] > 0 else "-") + str(circuit + 1) + " ")
     circuits_to_orders_file = open("./outputs/circuits_to_orders_signed.txt", "w")
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = [1, 2, 3, 4, 5, 6, 7, 8]
-    line = str(fitness) + "\n"
-    line_positive = str(fitness) + " +" + "\n"
-    line_negative = str(fitness) + " -" + "\n"
-    circuits_to_orders_file.write(line)
-    for circuit in range(1, 21):
-        if line_positive in open("./outputs/circuit_%s_orders_signed.txt" % circuit, "r"):
-            circuits_to_orders_file.write("+" + str(circuit) + " ")
-        elif line_negative in open("./outputs/circuit_%s_orders_signed.txt" % circuit, "r"):
-            circuits_to_orders_file.write("-" + str(circuit) + " ")
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        line = str(fitness) + "\n"
-        line_positive = str(fitness) + " +" + "\n"
-        line_negative = str(fitness) + " -" + "\n"
-        circuits_to_orders_file.write("\n" + line)
-        for circuit in range(1, 21):
-            if line_positive in open("./outputs/circuit_%s_orders_signed.txt" % circuit, "r"):
-                circuits_to_orders_file.write("+" + str(circuit) + " ")
-            elif line_negative in open("./outputs/circuit_%s_orders_signed.txt" % circuit, "r"):
-                circuits_to_orders_file.write("-" + str(circuit) + " ")
+    circuits_to_orders_file.write("".join(lines))
     circuits_to_orders_file.close()
 
 # To generate the big file, call:
-# orders_to_circuits()
 # circuits_to_orders_signed()
+# The files with the rankings for every circuit are generated by orders_to_circuits().
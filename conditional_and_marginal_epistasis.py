@@ -1,4 +1,7 @@
 import numpy as np
+from fitness_landscape import landscape_from_dict
+from walsh_hadamard import data_to_array, interaction_coordinates, effective_sample_sizes, marginal_two_way, \
+    marginal_three_way, conditional_two_way, conditional_three_way
 
 __author__ = "@gavruskin"
 
@@ -13,22 +16,11 @@ def genotype_look_good(genotype, n):
 
 # Returns a file with comprehensive analysis of conditional epistasis.
 # TODO: update and finish this.
-# data is a dictionary, num_sites == total number of sites,
+# data is a FitnessLandscape or a dictionary as in fitness_landscape.landscape_from_dict (which is not modified).
 def conditional_two_way_interaction_analysis(data):
-    number_trials = 0
-    for genotype in data:
-        number_trials = len(data[genotype])
-        break
-    print("Missing data is currently not supported by conditional two-way interaction analysis. "
-          "Make sure your fitness values do not have missing data.\n")
-    # TODO: Add support for missing data.
-    n = 0  # Number of sites.
-    for genotype in data:
-        if len(genotype) > n:
-            n = len(genotype)
+    landscape = landscape_from_dict(data)
+    n = landscape.number_loci  # Number of sites.
     m = 2 ** (n - 2)  # Number of sequence to condition on
-    for genotype in data:  # Make the genotypes look good (all of the same length):
-        data[genotype_look_good(genotype, n)] = data.pop(genotype)
 
     output_file = open("outputs/conditional_two_way_epistasis_analysis.md", "w")
     output_file.write("This file has been created using software package Fitlands "
@@ -39,32 +31,19 @@ def conditional_two_way_interaction_analysis(data):
                       "If you publish the results obtained with the help of this software, "
                       "please don't forget to cite us.\n")
     output_file.write("\n\n# Conditional two-way interaction analysis\n\n")
+    output_file.write("Interactions in trials with missing data are shown as --\n")
 
-    epi_matrix = np.empty([number_trials, n, n, m], dtype=float)  # Compute epistasis.
-    for trial in range(number_trials):
-        for i in range(n):
-            for j in range(i + 1, n):
-                for k in range(m):  # Loop through sites (i, j) to find the interaction conditioning on genotype #k.
-                    epi = 0
-                    genotype_condition = genotype_look_good("{0:b}".format(k), n - 2)
-                    for genotype in data:
-                        genotype_background = genotype[:i] + genotype[i + 1:j] + genotype[j + 1:]
-                        if genotype_background == genotype_condition:
-                            if genotype[i] == genotype[j] == "0" or genotype[i] == genotype[j] == "1":
-                                epi += data[genotype][trial]
-                            elif (genotype[i] == "0" and genotype[j] == "1") or \
-                                    (genotype[i] == "1" and genotype[j] == "0"):
-                                epi -= data[genotype][trial]
-                            else:
-                                print(
-                                    "Attention! Your genotypes contain entries different from 0 and 1. "
-                                    "Those are skipped.")
-                    epi_matrix[trial][i][j][k] = epi
+    values = data_to_array(landscape)  # Compute epistasis for all pairs of loci and all backgrounds at once.
+    number_trials = len(values)
+    epi_matrix = conditional_two_way(values)
+    sample_sizes = effective_sample_sizes(epi_matrix)  # Trials with all genotypes of the subcube measured.
 
     for i in range(n):
         for j in range(i + 1, n):
             output_file.write("\n## Locus %s and %s\n\n" % (i + 1, j + 1))
             for k in range(m):
+                output_file.write("Conditioning on %s, the number of trials without missing data is %s\n" %
+                                  (genotype_look_good("{0:b}".format(k), n - 2), sample_sizes[i][j][k]))
                 for trial in range(number_trials):
                     output_file.write("Conditioning on %s, the interaction (epistasis) in trial %s is %s\n" %
                                 (genotype_look_good("{0:b}".format(k), n - 2), trial + 1, epi_matrix[trial][i][j][k]))
@@ -75,22 +54,52 @@ def conditional_two_way_interaction_analysis(data):
     return epi_matrix
 
 
+# Returns a file with comprehensive analysis of conditional three-way interactions, data as in the two-way analysis.
+def conditional_three_way_interaction_analysis(data):
+    landscape = landscape_from_dict(data)
+    n = landscape.number_loci  # Number of sites.
+    m = 2 ** (n - 3)  # Number of sequence to condition on
+
+    output_file = open("outputs/conditional_three_way_epistasis_analysis.md", "w")
+    output_file.write("This file has been created using software package Fitlands "
+                      "(Alex Gavryushkin, CBG, D-BSSE, ETH Zurich).\n"
+                      "Please refer to [https://github.com/gavruskin/fitlands] for legal matters, "
+                      "to obtain up-to-date bibliographic information for Fitlands, "
+                      "and to stay tuned.\n"
+                      "If you publish the results obtained with the help of this software, "
+                      "please don't forget to cite us.\n")
+    output_file.write("\n\n# Conditional three-way interaction analysis\n\n")
+    output_file.write("Interactions in trials with missing data are shown as --\n")
+
+    values = data_to_array(landscape)  # Compute interactions for all triples of loci and all backgrounds at once.
+    number_trials = len(values)
+    epi_matrix = conditional_three_way(values)
+    sample_sizes = effective_sample_sizes(epi_matrix)  # Trials with all genotypes of the subcube measured.
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            for k in range(j + 1, n):
+                output_file.write("\n## Locus %s, %s, and %s\n\n" % (i + 1, j + 1, k + 1))
+                for background in range(m):
+                    output_file.write("Conditioning on %s, the number of trials without missing data is %s\n" %
+                                      (genotype_look_good("{0:b}".format(background), n - 3),
+                                       sample_sizes[i][j][k][background]))
+                    for trial in range(number_trials):
+                        output_file.write("Conditioning on %s, the three-way interaction in trial %s is %s\n" %
+                                          (genotype_look_good("{0:b}".format(background), n - 3), trial + 1,
+                                           epi_matrix[trial][i][j][k][background]))
+                    output_file.write("\n")
+    output_file.close()
+    print("The output has been written into file conditional_three_way_epistasis_analysis.md in the ./outputs "
+          "directory.\n")
+    return epi_matrix
+
+
 # Returns a file with comprehensive analysis of marginal two-way epistasis epistasis.
-# data is a dictionary with genotypes as keys and fitness values across the trials as a list.
+# data is a FitnessLandscape or a dictionary with genotypes as keys and fitness values across the trials as a list.
 def marginal_two_way_interaction_analysis(data):
-    number_trials = 0
-    for genotype in data:
-        number_trials = len(data[genotype])
-        break
-    print("Missing data is currently not supported by two-way interaction analysis. "
-          "Make sure your fitness values do not have missing data.\n")
-    # TODO: Add support for missing data.
-    n = 0  # Number of sites.
-    for genotype in data:
-        if len(genotype) > n:
-            n = len(genotype)
-    for genotype in data:  # Make the genotypes look good (all of the same length):
-        data[genotype_look_good(genotype, n)] = data.pop(genotype)
+    landscape = landscape_from_dict(data)
+    n = landscape.number_loci  # Number of sites.
 
     output_file = open("outputs/two_way_epistasis_analysis.md", "w")
     output_file.write("This file has been created using software package Fitlands "
@@ -101,20 +110,11 @@ def marginal_two_way_interaction_analysis(data):
                       "If you publish the results obtained with the help of this software, "
                       "please don't forget to cite us.\n")
     output_file.write("\n\n# Marginal two-way interaction (epistasis) analysis\n")
+    output_file.write("\nInteractions in trials with missing data are shown as --\n")
 
-    epi_matrix = np.empty([number_trials, n, n], dtype=float)  # Compute epistasis.
-    for trial in range(number_trials):
-        for i in range(n):
-            for j in range(i + 1, n):  # Loop through pairs of sites (i, j) to find marginal epistasis between i and j.
-                epi = 0
-                for genotype in data:
-                    if genotype[i] == genotype[j] == "0" or genotype[i] == genotype[j] == "1":
-                        epi += data[genotype][trial]
-                    elif (genotype[i] == "0" and genotype[j] == "1") or (genotype[i] == "1" and genotype[j] == "0"):
-                        epi -= data[genotype][trial]
-                    else:
-                        print("Attention! Your genotypes contain entries different from 0 and 1. Those are skipped.")
-                epi_matrix[trial][i][j] = epi
+    coordinates = interaction_coordinates(landscape)  # Compute epistasis as slices of all interaction coordinates.
+    epi_matrix = marginal_two_way(coordinates)
+    sample_sizes = effective_sample_sizes(epi_matrix)  # Trials with all genotypes measured.
 
     epi_pos_percent = np.empty([n, n], dtype=float)  # Compute summaries of epistasis.
     epi_neg_percent = np.empty([n, n], dtype=float)
@@ -127,19 +127,14 @@ def marginal_two_way_interaction_analysis(data):
     epi_suspected_zero_sites = []
     for i in range(n):
         for j in range(i + 1, n):
-            epi_pos_count = 0
-            epi_neg_count = 0
-            epi_zero_count = 0
-            for trial in range(number_trials):
-                if epi_matrix[trial][i][j] > 0:
-                    epi_pos_count += 1
-                elif epi_matrix[trial][i][j] < 0:
-                    epi_neg_count += 1
-                else:
-                    epi_zero_count += 1
-            epi_pos_percent[i][j] = 100 * epi_pos_count / float(number_trials)
-            epi_neg_percent[i][j] = 100 * epi_neg_count / float(number_trials)
-            epi_zero_percent[i][j] = 100 * epi_zero_count / float(number_trials)
+            # Masked (missing) trials are not counted, even if all trials are masked.
+            epi_pos_count = int(np.count_nonzero((epi_matrix[:, i, j] > 0).filled(False)))
+            epi_neg_count = int(np.count_nonzero((epi_matrix[:, i, j] < 0).filled(False)))
+            epi_zero_count = int(np.count_nonzero((epi_matrix[:, i, j] == 0).filled(False)))
+            number_trials = sample_sizes[i][j]
+            epi_pos_percent[i][j] = 100 * epi_pos_count / float(max(number_trials, 1))
+            epi_neg_percent[i][j] = 100 * epi_neg_count / float(max(number_trials, 1))
+            epi_zero_percent[i][j] = 100 * epi_zero_count / float(max(number_trials, 1))
             if epi_pos_percent[i][j] == 100:
                 epi_pos_sites.append([i, j])
             elif epi_neg_percent[i][j] == 100:
@@ -183,9 +178,10 @@ def marginal_two_way_interaction_analysis(data):
             output_file.write("Probability of positive epistasis is: %s%%\n"
                               "Probability of negative epistasis is: %s%%\n"
                               "Probability of no epistasis is: %s%%\n"
+                              "Number of trials without missing data is: %s\n"
                               % (round(epi_pos_percent[i][j], 2), round(epi_neg_percent[i][j], 2),
-                                 round(epi_zero_percent[i][j], 2)))
-            for trial in range(number_trials):
+                                 round(epi_zero_percent[i][j], 2), sample_sizes[i][j]))
+            for trial in range(len(epi_matrix)):
                 output_file.write("Epistasis value for sites %s and %s in trial %s is %s\n"
                                   % (i + 1, j + 1, trial + 1, epi_matrix[trial][i][j]))
             output_file.write("\n")
@@ -195,20 +191,10 @@ def marginal_two_way_interaction_analysis(data):
     return epi_matrix
 
 
+# Returns a file with comprehensive analysis of marginal three-way interactions, data as in the two-way analysis.
 def marginal_three_way_interaction_analysis(data):
-    number_trials = 0
-    for genotype in data:
-        number_trials = len(data[genotype])
-        break
-    print("Missing data is currently not supported by three-way interaction analysis. "
-          "Make sure your fitness values do not have missing data.\n")
-    # TODO: Add support for missing data.
-    n = 0  # Number of sites.
-    for genotype in data:
-        if len(genotype) > n:
-            n = len(genotype)
-    for genotype in data:  # Make the genotypes look good (all of the same length):
-        data[genotype_look_good(genotype, n)] = data.pop(genotype)
+    landscape = landscape_from_dict(data)
+    n = landscape.number_loci  # Number of sites.
 
     output_file = open("outputs/three_way_epistasis_analysis.md", "w")
     output_file.write("This file has been created using software package Fitlands "
@@ -219,30 +205,11 @@ def marginal_three_way_interaction_analysis(data):
                       "If you publish the results obtained with the help of this software, "
                       "please don't forget to cite us.\n")
     output_file.write("\n\n# Marginal three-way interaction analysis\n")
+    output_file.write("\nInteractions in trials with missing data are shown as --\n")
 
-    epi_matrix = np.empty([number_trials, n, n, n], dtype=float)  # Compute epistasis.
-    for trial in range(number_trials):
-        for i in range(n):
-            for j in range(i + 1, n):
-                for k in range(j + 1, n):  # Loop through sites (i, j, k) to find marginal interaction (u_111).
-                    epi = 0
-                    for genotype in data:
-                        count_ones = 0
-                        if genotype[i] == "1":
-                            count_ones += 1
-                        if genotype[j] == "1":
-                            count_ones += 1
-                        if genotype[k] == "1":
-                            count_ones += 1
-                        if (genotype[i] != "0" and genotype[i] != "1") or (genotype[j] != "0" and genotype[j] != "1") \
-                                or (genotype[k] != "0" and genotype[k] != "1"):
-                            print("Attention! Your genotypes contain entries different from 0 and 1."
-                                  "Those are set to 0.")
-                        if count_ones % 2 == 0:
-                            epi += data[genotype][trial]
-                        else:
-                            epi -= data[genotype][trial]
-                    epi_matrix[trial][i][j][k] = epi
+    coordinates = interaction_coordinates(landscape)  # Compute epistasis as slices of all interaction coordinates.
+    epi_matrix = marginal_three_way(coordinates)
+    sample_sizes = effective_sample_sizes(epi_matrix)  # Trials with all genotypes measured.
 
     epi_pos_percent = np.empty([n, n, n], dtype=float)  # Compute summaries of epistasis.
     epi_neg_percent = np.empty([n, n, n], dtype=float)
@@ -256,19 +223,14 @@ def marginal_three_way_interaction_analysis(data):
     for i in range(n):
         for j in range(i + 1, n):
             for k in range(j + 1, n):
-                epi_pos_count = 0
-                epi_neg_count = 0
-                epi_zero_count = 0
-                for trial in range(number_trials):
-                    if epi_matrix[trial][i][j][k] > 0:
-                        epi_pos_count += 1
-                    elif epi_matrix[trial][i][j][k] < 0:
-                        epi_neg_count += 1
-                    else:
-                        epi_zero_count += 1
-                epi_pos_percent[i][j][k] = 100 * epi_pos_count / float(number_trials)
-                epi_neg_percent[i][j][k] = 100 * epi_neg_count / float(number_trials)
-                epi_zero_percent[i][j][k] = 100 * epi_zero_count / float(number_trials)
+                # Masked (missing) trials are not counted, even if all trials are masked.
+                epi_pos_count = int(np.count_nonzero((epi_matrix[:, i, j, k] > 0).filled(False)))
+                epi_neg_count = int(np.count_nonzero((epi_matrix[:, i, j, k] < 0).filled(False)))
+                epi_zero_count = int(np.count_nonzero((epi_matrix[:, i, j, k] == 0).filled(False)))
+                number_trials = sample_sizes[i][j][k]
+                epi_pos_percent[i][j][k] = 100 * epi_pos_count / float(max(number_trials, 1))
+                epi_neg_percent[i][j][k] = 100 * epi_neg_count / float(max(number_trials, 1))
+                epi_zero_percent[i][j][k] = 100 * epi_zero_count / float(max(number_trials, 1))
                 if epi_pos_percent[i][j][k] == 100:
                     epi_pos_sites.append([i, j, k])
                 elif epi_neg_percent[i][j][k] == 100:
@@ -313,9 +275,10 @@ def marginal_three_way_interaction_analysis(data):
                 output_file.write("Probability of positive three-way interaction is: %s%%\n"
                                   "Probability of negative three-way interaction is: %s%%\n"
                                   "Probability of no three-way interaction is: %s%%\n"
+                                  "Number of trials without missing data is: %s\n"
                                   % (round(epi_pos_percent[i][j][k], 2), round(epi_neg_percent[i][j][k], 2),
-                                     round(epi_zero_percent[i][j][k], 2)))
-                for trial in range(number_trials):
+                                     round(epi_zero_percent[i][j][k], 2), sample_sizes[i][j][k]))
+                for trial in range(len(epi_matrix)):
                     output_file.write("Interaction value for sites %s, %s, %s in trial %s is %s\n"
                                       % (i + 1, j + 1, k + 1, trial + 1, epi_matrix[trial][i][j][k]))
                 output_file.write("\n")
@@ -323,3 +286,13 @@ def marginal_three_way_interaction_analysis(data):
     output_file.close()
     print("The output has been written into file three_way_epistasis_analysis.md in the ./outputs directory.\n")
     return epi_matrix
+
+
+# Regression run on data with a genotype missing in all trials, so that all marginal interactions are masked.
+if __name__ == "__main__":
+    marginal_two_way_interaction_analysis({"00": [1, 2, 3], "01": [2, 3, 1], "10": [1, 1, 1]})
+    data_missing_genotype = {"000": [1, 2, 3], "001": [2, 3, 1], "010": [1, 1, 1], "100": [2, 2, 1],
+                             "011": [3, 1, 2], "101": [1, 3, 3], "110": [2, 1, 1]}
+    marginal_three_way_interaction_analysis(data_missing_genotype)
+    conditional_two_way_interaction_analysis(data_missing_genotype)
+    conditional_three_way_interaction_analysis(data_missing_genotype)
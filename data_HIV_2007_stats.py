@@ -1,6 +1,6 @@
-import pandas as pd
 import numpy as np
 from three_way_epistasis import check_for_epistasis
+from fitness_landscape import landscape_from_sites_csv, landscape_to_lists
 
 
 __author__ = '@gavruskin'
@@ -30,43 +30,9 @@ maxim = [2.0530, 1.7850, 1.5310, 1.8750, 1.7240, 1.8870, 1.6920, 1.7900]
 def get_mean_fitness(data_file, mutations, sites, mean_type=""):  # Default mean_type returns all possible combinations
     # of fitness values for the fist n values where n is the min number of fitness measurements over all genotypes.
     # This should not be used!
-    sites = [0] + sites  # This is specific to the data file. Column 0 contains fitness, column 1 names.
-    values = pd.read_csv(data_file, usecols=sites)
-    values.iloc[:, 0] = np.log10(values.iloc[:, 0])
-    size = len(values.iloc[:, 1])
-    f000 = []
-    f001 = []
-    f010 = []
-    f100 = []
-    f011 = []
-    f101 = []
-    f110 = []
-    f111 = []
-    for s in range(size):
-        if (values.iloc[s, 1] == mutations[0][0]) & (values.iloc[s, 2] == mutations[1][0]) &\
-                (values.iloc[s, 3] == mutations[2][0]):
-            f000.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][0]) & (values.iloc[s, 2] == mutations[1][0]) &\
-                (values.iloc[s, 3] == mutations[2][1]):
-            f001.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][0]) & (values.iloc[s, 2] == mutations[1][1]) &\
-                (values.iloc[s, 3] == mutations[2][0]):
-            f010.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][1]) & (values.iloc[s, 2] == mutations[1][0]) &\
-                (values.iloc[s, 3] == mutations[2][0]):
-            f100.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][0]) & (values.iloc[s, 2] == mutations[1][1]) &\
-                (values.iloc[s, 3] == mutations[2][1]):
-            f011.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][1]) & (values.iloc[s, 2] == mutations[1][0]) &\
-                (values.iloc[s, 3] == mutations[2][1]):
-            f101.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][1]) & (values.iloc[s, 2] == mutations[1][1]) &\
-                (values.iloc[s, 3] == mutations[2][0]):
-            f110.append(values.iloc[s, 0])
-        elif (values.iloc[s, 1] == mutations[0][1]) & (values.iloc[s, 2] == mutations[1][1]) &\
-                (values.iloc[s, 3] == mutations[2][1]):
-            f111.append(values.iloc[s, 0])
+    # Column 0 contains fitness (specific to the data file):
+    landscape = landscape_from_sites_csv(data_file, [[sites[k], mutations[k][0], mutations[k][1]] for k in range(3)])
+    f000, f001, f010, f100, f011, f101, f110, f111 = landscape_to_lists(landscape)
     if mean_type == "mean":
         w = [np.mean(f000), np.mean(f001), np.mean(f010), np.mean(f100), np.mean(f011), np.mean(f101),
              np.mean(f110), np.mean(f111)]
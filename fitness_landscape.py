@@ -0,0 +1,165 @@
+import os.path
+import numpy as np
+import pandas as pd
+from genotype_space import get_genotype_space
+
+__author__ = "@gavruskin"
+
+
+# Fitness measurements of all genotypes on number_loci biallelic loci across trials.
+# values is a contiguous (2^number_loci, number_trials) array, row g holding the trials of the genotype with bit
+# pattern g, locus 1 being the leftmost (most significant) bit as in genotype_space, e.g. row 3 is genotype 011.
+# missing is the boolean array of the same shape marking the missing measurements (by default, the NaN values).
+# Example of usage:
+# landscape = landscape_from_dict({"0": [1, 1.1], "1": [2, 2.1], "10": [2, 1.9], "11": [5, 4.8]})
+# landscape.fitness("10") == landscape.values[2], landscape.trial(0) is the landscape of the first trial.
+class FitnessLandscape:
+    def __init__(self, values, missing=None):
+        self.values = np.ascontiguousarray(values, dtype=float)
+        if self.values.ndim == 1:
+            self.values = self.values.reshape(-1, 1)
+        self.size, self.number_trials = self.values.shape
+        self.number_loci = self.size.bit_length() - 1
+        if self.size != 2 ** self.number_loci:
+            raise ValueError("FitnessLandscape received %s genotypes, which is not a power of two." % self.size)
+        if missing is None:
+            missing = np.isnan(self.values)
+        self.missing = np.ascontiguousarray(missing, dtype=bool)
+
+    # Returns the row of fitness values across the trials of genotype given as a string of 0's and 1's (possibly
+    # without the leading 0's) or as its bit pattern.
+    def fitness(self, genotype):
+        if isinstance(genotype, str):
+            genotype = int(genotype, 2)
+        return self.values[genotype]
+
+    # Returns the view of the fitness values of all genotypes in trial number trial (from 0).
+    def trial(self, trial):
+        return self.values[:, trial]
+
+    # Returns the view of values as a (2, ..., 2, number_trials) tensor, axis i being locus i + 1.
+    def tensor(self):
+        return self.values.reshape((2,) * self.number_loci + (self.number_trials,))
+
+    # Returns the view of the subcube of genotypes given by pattern, a string of 0's, 1's, and *'s (free loci), e.g.
+    # "1*0*": the output has shape (2, 2, number_trials), entry [a, b, trial] being the fitness of genotype 1a0b.
+    def subcube(self, pattern):
+        if len(pattern) != self.number_loci or pattern.strip("01*") != "":
+            raise ValueError("%s is not a subcube pattern on %s loci." % (pattern, self.number_loci))
+        index = tuple([slice(None) if allele == "*" else int(allele) for allele in pattern])
+        return self.tensor()[index]
+
+    # Returns the (2^number_loci, number_trials) masked array of the measurements.
+    def masked_values(self):
+        return np.ma.masked_array(self.values, self.missing)
+
+    # Returns the mean fitness of every genotype over its available trials (NaN if there are none).
+    def means(self):
+        return self.masked_values().mean(axis=1).filled(np.nan)
+
+    # Returns the dictionary with genotypes (strings of length number_loci) as keys and lists of fitness values as
+    # values, with None for the missing measurements.
+    def to_dict(self):
+        output = {}
+        for genotype in range(self.size):
+            output[format(genotype, "0%sb" % self.number_loci)] = \
+                [None if self.missing[genotype, trial] else float(self.values[genotype, trial])
+                 for trial in range(self.number_trials)]
+        return output
+
+
+# Returns the FitnessLandscape of data, a dictionary with genotypes (strings or integers of 0's and 1's, possibly
+# without the leading 0's) as keys and lists (or pandas Series) of fitness values across the trials as values.
+# Genotypes missing from data and trials missing at the end of the shorter lists are marked missing, as are None and
+# NaN.
+# data is not modified. A FitnessLandscape is returned as it is.
+def landscape_from_dict(data):
+    if isinstance(data, FitnessLandscape):
+        return data
+    number_loci = max([len(str(genotype)) for genotype in data])
+    number_trials = max([len(data[genotype]) for genotype in data])
+    values = np.full([2 ** number_loci, number_trials], np.nan)
+    for genotype in data:
+        genotype_string = str(genotype)
+        if genotype_string.strip("01") != "":
+            print("Attention! Your genotypes contain entries different from 0 and 1. Those are skipped.")
+            continue
+        trials = [np.nan if value is None else value for value in list(data[genotype])]
+        values[int(genotype_string, 2), :len(trials)] = trials
+    return FitnessLandscape(values)
+
+
+# Returns the FitnessLandscape of the csv file data_file whose first row contains names of columns, first column
+# contains genotypes (with or without the leading 0's), and the other columns contain the trials, as in
+# two_and_three_way_interactions.
+def landscape_from_csv(data_file):
+    table = pd.read_csv(data_file, dtype=str)
+    data = {}
+    for row in range(len(table)):
+        data[table.iloc[row, 0].strip()] = table.iloc[row, 1:].to_numpy(dtype=float)
+    return landscape_from_dict(data)
+
+
+# Returns the FitnessLandscape of the genotypes given by sites in the csv file data_file, one measurement per row.
+# sites is the list of triples [column, wild type, mutant], e.g. [[88, "L", "M"], [244, "M", "V"], [275, "t", "Y"]],
+# column being the number of the column (from 0) with the allele of the site and locus 1 being the first site.
+# The fitness is taken from column fitness_column, on log10 scale if log10 == True. Rows with alleles other than the
+# wild type and the mutant at any of the sites are skipped, and so are the measurements which are not numbers.
+# On log10 scale, fitness 0 (e.g. of a non-viable genotype) is kept as -inf, the lowest fitness, and negative fitness
+# (whose log10 is not a number) is skipped. If drop_non_positive == True, all rows with fitness which is not positive
+# are skipped instead, and their number is reported.
+# Only the needed columns are read, the genotypes of all rows are encoded as bit patterns at once, and the
+# measurements are grouped by genotype (keeping the order of the rows) in one groupby.
+# If cache_file is given, the landscape is saved there (in the NumPy .npz format) and loaded from there next time,
+# unless it was created from another data file, other sites, or the data file has changed (its size or modification
+# time are different).
+def landscape_from_sites_csv(data_file, sites, fitness_column=0, log10=True, cache_file=None,
+                             drop_non_positive=False):
+    key = repr([data_file, os.path.getsize(data_file), os.path.getmtime(data_file), [list(site) for site in sites],
+                fitness_column, log10, drop_non_positive])
+    if cache_file is not None and os.path.isfile(cache_file):
+        cache = np.load(cache_file)
+        if str(cache["key"]) == key:
+            return FitnessLandscape(cache["values"], cache["missing"])
+    header = pd.read_csv(data_file, nrows=0).columns
+    fitness_name = header[fitness_column]
+    site_names = [header[site[0]] for site in sites]
+    table = pd.read_csv(data_file, usecols=[fitness_column] + [site[0] for site in sites])
+    number_loci = len(sites)
+    genotypes = np.zeros(len(table), dtype=np.int64)
+    known = np.ones(len(table), dtype=bool)
+    for locus in range(number_loci):
+        alleles = table[site_names[locus]]
+        mutant = (alleles == sites[locus][2]).to_numpy()
+        known &= mutant | (alleles == sites[locus][1]).to_numpy()
+        genotypes |= mutant.astype(np.int64) << (number_loci - 1 - locus)
+    fitness = pd.to_numeric(table[fitness_name], errors="coerce").to_numpy(dtype=float)
+    known &= ~np.isnan(fitness)
+    if log10:
+        if drop_non_positive:
+            number_not_positive = int(np.count_nonzero(known & (fitness <= 0)))
+            known &= fitness > 0
+            if number_not_positive > 0:
+                print("landscape_from_sites_csv skipped %s rows with fitness which is not positive."
+                      % number_not_positive)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fitness = np.log10(fitness)  # 0 becomes -inf, negative numbers become NaN.
+        known &= ~np.isnan(fitness)
+    measurements = pd.Series(fitness[known]).groupby(genotypes[known], sort=True)
+    counts = measurements.size()
+    values = np.full([2 ** number_loci, max(counts.max() if len(counts) > 0 else 0, 1)], np.nan)
+    for genotype, trials in measurements:
+        values[genotype, :len(trials)] = trials.to_numpy()
+    landscape = FitnessLandscape(values)
+    if cache_file is not None:
+        np.savez(cache_file, values=landscape.values, missing=landscape.missing, key=key)
+    return landscape
+
+
+# Returns the list of lists of available fitness values of all genotypes of landscape, in the order of the genotype
+# indices of genotype_space (by default, 000, 001, 010, 100, 011, 101, 110, 111 for three loci).
+def landscape_to_lists(landscape, order="mutations"):
+    output = []
+    for genotype in get_genotype_space(landscape.number_loci, order).bits:
+        output.append(landscape.values[genotype][~landscape.missing[genotype]].tolist())
+    return output
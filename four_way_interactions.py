@@ -1,4 +1,5 @@
-from three_way_epistasis import epistasis_positive, epistasis_negative
+from three_way_epistasis import epistasis_positive, epistasis_negative, epistasis_signs
+from genotype_space import get_genotype_space
 import numpy
 
 __author__ = '@gavruskin'
@@ -26,98 +27,14 @@ def get_geno_number(genotype_binary):
 # u1101 = 0000 + 0010 + 0101 + 0111 + 1001 + 1011 + 1100 + 1110 - 0001 - 0011 - 0100 - 0110 - 1000 - 1010 - 1101 - 1111
 # u1110 = 0000 + 0001 + 0110 + 0111 + 1010 + 1011 + 1100 + 1101 - 0010 - 0011 - 0100 - 0101 - 1000 - 1001 - 1110 - 1111
 # u1111 = even_number_of_1 - odd_number_of_1
+# The signs above are computed by genotype_space.GenotypeSpace.interaction_coordinate.
 def four_way_from_ranking(w, u=1111):
     w = [get_geno_number(i) for i in w]
     repetitions = [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
     output = []
-    # u_0101
-    if u == 11:
-        positives = { get_geno_number(0), get_geno_number(100), get_geno_number(1000), get_geno_number(1100),
-                     get_geno_number(11), get_geno_number(111), get_geno_number(1011), get_geno_number(1111)}
-        negatives = { get_geno_number(1), get_geno_number(101), get_geno_number(1001), get_geno_number(1101),
-                     get_geno_number(10), get_geno_number(110), get_geno_number(1010), get_geno_number(1110)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_0011
-    if u == 101:
-        positives = {  get_geno_number(0),  get_geno_number(10), get_geno_number(1000), get_geno_number(1010),
-                     get_geno_number(101), get_geno_number(111), get_geno_number(1101), get_geno_number(1111)}
-        negatives = {  get_geno_number(1),  get_geno_number(11), get_geno_number(1001), get_geno_number(1011),
-                     get_geno_number(100), get_geno_number(110), get_geno_number(1100), get_geno_number(1110)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_0110
-    if u == 110:
-        positives = {  get_geno_number(0),   get_geno_number(1), get_geno_number(1000), get_geno_number(1001),
-                     get_geno_number(110), get_geno_number(111), get_geno_number(1110), get_geno_number(1111)}
-        negatives = { get_geno_number(10),  get_geno_number(11), get_geno_number(1010), get_geno_number(1011),
-                     get_geno_number(100), get_geno_number(101), get_geno_number(1100), get_geno_number(1101)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1001
-    if u == 1001:
-        positives = {   get_geno_number(0),   get_geno_number(10),  get_geno_number(100),  get_geno_number(110),
-                     get_geno_number(1001), get_geno_number(1011), get_geno_number(1101), get_geno_number(1111)}
-        negatives = {   get_geno_number(1),   get_geno_number(11),  get_geno_number(101),  get_geno_number(111),
-                     get_geno_number(1000), get_geno_number(1010), get_geno_number(1100), get_geno_number(1110)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1010
-    if u == 1010:
-        positives = {   get_geno_number(0),    get_geno_number(1),  get_geno_number(100),  get_geno_number(101),
-                     get_geno_number(1010), get_geno_number(1011), get_geno_number(1110), get_geno_number(1111)}
-        negatives = {  get_geno_number(10),   get_geno_number(11),  get_geno_number(110),  get_geno_number(111),
-                     get_geno_number(1000), get_geno_number(1001), get_geno_number(1100), get_geno_number(1101)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1100
-    if u == 1100:
-        positives = {   get_geno_number(0),    get_geno_number(1),   get_geno_number(10),   get_geno_number(11),
-                     get_geno_number(1100), get_geno_number(1101), get_geno_number(1110), get_geno_number(1111)}
-        negatives = { get_geno_number(100),  get_geno_number(101),  get_geno_number(110),  get_geno_number(111),
-                     get_geno_number(1000), get_geno_number(1001), get_geno_number(1010), get_geno_number(1011)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_0111
-    if u == 111:
-        positives = {  get_geno_number(0), get_geno_number(1000),  get_geno_number(11), get_geno_number(1011),
-                     get_geno_number(101), get_geno_number(1101), get_geno_number(110), get_geno_number(1110)}
-        negatives = {  get_geno_number(1), get_geno_number(1001),  get_geno_number(10), get_geno_number(1010),
-                     get_geno_number(100), get_geno_number(1100), get_geno_number(111), get_geno_number(1111)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1011
-    if u == 1011:
-        positives = {   get_geno_number(0),  get_geno_number(100),   get_geno_number(11),  get_geno_number(111),
-                     get_geno_number(1001), get_geno_number(1101), get_geno_number(1010), get_geno_number(1110)}
-        negatives = {   get_geno_number(1),  get_geno_number(101),   get_geno_number(10),  get_geno_number(110),
-                     get_geno_number(1000), get_geno_number(1100), get_geno_number(1011), get_geno_number(1111)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1101
-    if u == 1101:
-        positives = {   get_geno_number(0),   get_geno_number(10),  get_geno_number(101),  get_geno_number(111),
-                     get_geno_number(1001), get_geno_number(1011), get_geno_number(1100), get_geno_number(1110)}
-        negatives = {   get_geno_number(1),   get_geno_number(11),  get_geno_number(100),  get_geno_number(110),
-                     get_geno_number(1000), get_geno_number(1010), get_geno_number(1101), get_geno_number(1111)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1110
-    if u == 1110:
-        positives = {get_geno_number(0), get_geno_number(1), get_geno_number(110), get_geno_number(111),
-                     get_geno_number(1010), get_geno_number(1011), get_geno_number(1100), get_geno_number(1101)}
-        negatives = {get_geno_number(10), get_geno_number(11), get_geno_number(100), get_geno_number(101),
-                     get_geno_number(1000), get_geno_number(1001), get_geno_number(1110), get_geno_number(1111)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
-    # u_1111
-    if u == 1111:
-        positives = {   get_geno_number(0),   get_geno_number(11),  get_geno_number(101),  get_geno_number(110),
-                     get_geno_number(1001), get_geno_number(1010), get_geno_number(1100), get_geno_number(1111)}
-        negatives = {   get_geno_number(1),   get_geno_number(10),  get_geno_number(100),  get_geno_number(111),
-                     get_geno_number(1000), get_geno_number(1011), get_geno_number(1101), get_geno_number(1110)}
-        output = [epistasis_positive(w, positives, negatives, repetitions),
-                  epistasis_negative(w, positives, negatives, repetitions)]
+    if len(str(u)) <= 4 and str(u).strip("01") == "" and str(u).count("1") >= 2:
+        positives, negatives = get_genotype_space(4, "binary").interaction_coordinate(u)
+        output = epistasis_signs(w, positives, negatives, repetitions)
     if not output:
         print("Four way interaction from ranking received something which is not an interaction coordinate as input.")
     return output
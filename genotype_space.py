@@ -0,0 +1,126 @@
+import random
+import numpy as np
+
+__author__ = "@gavruskin"
+
+
+# The space of genotypes on number_loci biallelic loci.
+# A genotype is a bit pattern: locus 1 is the leftmost (most significant) bit, e.g. genotype 011 on three loci is 3.
+# As everywhere in the package, genotypes are also numbered by indices 1, ..., 2^number_loci.
+# With order == "mutations" (default), genotypes are numbered by the number of mutations and then by the bit pattern,
+# which for three loci is the convention 000 = 1, 001 = 2, 010 = 3, 100 = 4, 011 = 5, 101 = 6, 110 = 7, 111 = 8.
+# With order == "binary", genotype with bit pattern g has index g + 1, as in four_way_interactions.get_geno_number.
+# Mutational neighbors are genotypes whose bit patterns differ in one bit, that is, whose XOR is a power of two.
+class GenotypeSpace:
+    def __init__(self, number_loci, order="mutations"):
+        if order not in ("mutations", "binary"):
+            raise ValueError("GenotypeSpace received order %s, which is neither 'mutations' nor 'binary'." % order)
+        self.number_loci = number_loci
+        self.size = 2 ** number_loci
+        self.order = order
+        patterns = np.arange(self.size, dtype=np.uint32)
+        if order == "mutations":
+            patterns = np.array(sorted(range(self.size), key=lambda g: (bin(g).count("1"), g)), dtype=np.uint32)
+        self.bits = patterns  # bits[index - 1] is the bit pattern of the genotype with this index.
+        self.indices = np.empty(self.size, dtype=np.uint32)  # indices[g] is the index of bit pattern g.
+        self.indices[patterns] = np.arange(1, self.size + 1, dtype=np.uint32)
+
+    # Returns the bit pattern of genotype given as a string or an integer of 0's and 1's, e.g. "011", 11, or 1011.
+    # Missing 0's in front of the genotype are allowed.
+    def genotype_to_bits(self, genotype):
+        genotype = str(genotype)
+        if len(genotype) > self.number_loci or genotype.strip("01") != "":
+            raise ValueError("%s is not a genotype on %s loci." % (genotype, self.number_loci))
+        return int(genotype, 2)
+
+    # Returns the index of genotype given as in genotype_to_bits.
+    def genotype_to_index(self, genotype):
+        return int(self.indices[self.genotype_to_bits(genotype)])
+
+    # Returns the genotype with index index as a string of length number_loci, e.g. "011".
+    def index_to_genotype(self, index):
+        return format(int(self.bits[index - 1]), "0%sb" % self.number_loci)
+
+    # Returns True if the genotypes with indices a and b are mutational neighbors.
+    def are_neighbors(self, a, b):
+        difference = int(self.bits[a - 1] ^ self.bits[b - 1])
+        return difference != 0 and difference & (difference - 1) == 0
+
+    # Returns the list of indices of the mutational neighbors of the genotype with index a.
+    def neighbors(self, a):
+        bits = int(self.bits[a - 1])
+        return [int(self.indices[bits ^ (1 << locus)]) for locus in range(self.number_loci)]
+
+    # Returns the list of edges [a, b] of the genotype cube, a < b, with a and b being neighbor indices.
+    def edges(self):
+        output = []
+        for a in range(1, self.size + 1):
+            for b in self.neighbors(a):
+                if a < b:
+                    output.append([a, b])
+        return output
+
+    # Returns [positives, negatives] (sets of indices) of the interaction coordinate u given as a genotype,
+    # e.g. u = 111 on three loci is the three-way interaction u_111 with positives {1, 5, 6, 7}, negatives {2, 3, 4, 8}.
+    # A genotype g has sign + in u if the number of mutations g shares with u is even and - otherwise.
+    def interaction_coordinate(self, u):
+        u = self.genotype_to_bits(u)
+        positives = set()
+        negatives = set()
+        for index in range(1, self.size + 1):
+            if bin(int(self.bits[index - 1]) & u).count("1") % 2 == 0:
+                positives.add(index)
+            else:
+                negatives.add(index)
+        return [positives, negatives]
+
+    # Returns [positives, negatives] of the total number_loci-way interaction, e.g. u_111 on three loci.
+    def total_interaction(self):
+        return self.interaction_coordinate("1" * self.number_loci)
+
+    # Iterates through all rankings of the genotype indices in the order of get_next_ordering.
+    # Only the current ranking is kept in memory.
+    def rankings(self):
+        return iterate_rankings(self.size)
+
+    # Returns random fitness values for all genotypes, sorted.
+    def random_fitness_values(self):
+        return sorted([random.uniform(0, 1) for _ in range(self.size)])
+
+
+_genotype_spaces = {}
+
+
+# Returns the GenotypeSpace for number_loci and order, constructed once.
+def get_genotype_space(number_loci=3, order="mutations"):
+    if (number_loci, order) not in _genotype_spaces:
+        _genotype_spaces[(number_loci, order)] = GenotypeSpace(number_loci, order)
+    return _genotype_spaces[(number_loci, order)]
+
+
+# Returns the number of loci of a genotype space with size genotypes, or None if size is not a power of two.
+def number_of_loci(size):
+    if size < 1 or size & (size - 1) != 0:
+        return None
+    return size.bit_length() - 1
+
+
+# Iterates through all rankings of {1, ..., n} in the order of get_next_ordering (three_way_epistasis): the ordering
+# is a mixed-radix counter whose i-th digit picks the next element among those not chosen yet.
+def iterate_rankings(n):
+    ordering = [1] * n
+    last = list(range(n, 0, -1))
+    while True:
+        remaining = list(range(1, n + 1))
+        ranking = []
+        for digit in ordering:
+            ranking.append(remaining.pop(digit - 1))
+        yield ranking
+        if ordering == last:
+            return
+        for i in range(n):
+            if ordering[i] < n - i:
+                ordering[i] += 1
+                for j in range(i):
+                    ordering[j] = 1
+                break
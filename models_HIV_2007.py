@@ -1,6 +1,10 @@
-import pandas
+import heapq
+import itertools
 import numpy
-from three_way_epistasis import get_next_ordering, ordering_to_fitness, epistasis_positive, epistasis_negative
+from permutation_table import get_all_rankings, epistasis_masks, rankings_to_ranks, adjacent_transpositions
+from three_way_epistasis import IncrementalEpistasisChecker
+from genotype_space import get_genotype_space, number_of_loci
+from fitness_landscape import landscape_from_sites_csv, landscape_to_lists
 
 
 __author__ = '@gavruskin'
@@ -8,135 +12,223 @@ __author__ = '@gavruskin'
 
 # Gives the probabilities output[i][j] = p_{i, j}, where {i, j} \subset {1, ..., 8} given trial lists using
 # p_{i, j} = P(W_i < W_j) = \sum_x P(W_j = x) * P(W_i < x):
-def ranking_probabilities(fit_data_list):
-    output = [[0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0]]
-    for j in range(8):
-        for i in range(8):
-            if i != j:
-                probability_j = 1 / float(len(fit_data_list[j]))  # That's P(W_j = x), which doesn't depend on x.
-                # Now find probability_i = \sum_x P(W_i < x):
-                count = 0
-                for x in range(len(fit_data_list[j])):  # This is \sum_x
-                    for r in range(len(fit_data_list[i])):
-                        if fit_data_list[i][r] < fit_data_list[j][x]:
-                            count += 1
-                probability_i = count / float(len(fit_data_list[i]))
-                # Multiply the running probability by p_{i, j}:
-                output[i][j] = probability_j * probability_i
-    return output
+# Works for any number of genotypes (e.g. 2^L for L loci). For every i, the trials of genotype i are sorted once and
+# the numbers of trials below every measured value x are found by binary search (numpy.searchsorted), then summed
+# over the trials of each genotype j, so that the whole matrix takes O(N log N) for N trials in total.
+# Ties W_i = W_j count as 0 if ties == "strict" (default, P(W_i < W_j) as above) and as 1/2 if ties == "half",
+# in which case p_{i, j} + p_{j, i} = 1.
+def ranking_probabilities(fit_data_list, ties="strict"):
+    if ties not in ("strict", "half"):
+        print("ranking_probabilities received ties = %s, which is neither 'strict' nor 'half'." % ties)
+        return
+    number_genotypes = len(fit_data_list)
+    sizes = numpy.array([len(trials) for trials in fit_data_list])
+    values = numpy.concatenate([numpy.asarray(trials, dtype=float) for trials in fit_data_list])
+    starts = numpy.concatenate([[0], numpy.cumsum(sizes)[:-1]])
+    count = numpy.empty([number_genotypes, number_genotypes])
+    for i in range(number_genotypes):
+        trials_i = numpy.sort(numpy.asarray(fit_data_list[i], dtype=float))
+        below = numpy.searchsorted(trials_i, values, side="left").astype(float)  # #{r : W_i[r] < x} for all x.
+        if ties == "half":
+            below += 0.5 * (numpy.searchsorted(trials_i, values, side="right") - below)
+        count[i] = numpy.add.reduceat(below, starts) if len(values) > 0 else 0
+    probability_j = 1 / sizes.astype(float)  # That's P(W_j = x), which doesn't depend on x.
+    output = probability_j[None, :] * (count / sizes.astype(float)[:, None])
+    numpy.fill_diagonal(output, 0)
+    return output.tolist()
+
+
+# Keeps at most top_k (all if top_k is None) most probable rankings as a min-heap of [log_prob, rank, ranking].
+def push_top_rankings(heap, log_probs, ranks, rankings, top_k):
+    if top_k is not None and len(log_probs) > top_k:
+        top = numpy.argpartition(log_probs, -top_k)[-top_k:]
+        log_probs, ranks, rankings = log_probs[top], ranks[top], rankings[top]
+    for log_prob, rank, ranking in zip(log_probs.tolist(), ranks.tolist(), rankings.tolist()):
+        if top_k is None or len(heap) < top_k:
+            heapq.heappush(heap, [log_prob, rank, ranking])
+        elif log_prob > heap[0][0]:
+            heapq.heapreplace(heap, [log_prob, rank, ranking])
+
+
+# Yields the batches [rankings, ranks, log-probabilities, positive, negative] of at most batch_size rankings of the
+# permutation table, the log-probability of a ranking being \sum_{i < j} log_p_ij[ranking[i] - 1, ranking[j] - 1] and
+# positive and negative the masks of the sign test of the circuit given by positives, negatives, and repetitions.
+def table_ranking_batches(log_p_ij, positives, negatives, repetitions, batch_size):
+    rankings = get_all_rankings(len(log_p_ij))
+    first, second = numpy.triu_indices(len(log_p_ij), 1)
+    for start in range(0, len(rankings), batch_size):
+        batch = rankings[start:start + batch_size]
+        indices = batch.astype(numpy.intp) - 1
+        log_probs = numpy.sum(log_p_ij[indices[:, first], indices[:, second]], axis=1)
+        epi_pos, epi_neg = epistasis_masks(batch, positives, negatives, repetitions)
+        yield [batch, numpy.arange(start, start + len(batch)), log_probs, epi_pos, epi_neg]
+
+
+# Yields the same batches as table_ranking_batches (in another order) without the table of all rankings: the rankings
+# are visited by the adjacent transposition walk (permutation_table.adjacent_transpositions), and a swap of a and b
+# changes the log-probability by log_p_ij[b - 1, a - 1] - log_p_ij[a - 1, b - 1] and the signs as in
+# IncrementalEpistasisChecker, so that every ranking takes O(1) time on top of copying it into the batch.
+# The factors p_ij = 0 are counted rather than summed, so that the sum of the finite logarithms stays finite.
+# Rankings with equal probabilities may come out in another order than with the table, because of rounding.
+def walk_ranking_batches(log_p_ij, positives, negatives, repetitions, batch_size):
+    n = len(log_p_ij)
+    finite = numpy.isfinite(log_p_ij)
+    finite_log_p = numpy.where(finite, log_p_ij, 0).tolist()
+    zero = (~finite).astype(int).tolist()
+    checker = IncrementalEpistasisChecker(positives, negatives, repetitions, range(1, n + 1))
+    w = checker.w
+    first, second = numpy.triu_indices(n, 1)
+    batch = numpy.empty([batch_size, n], dtype=numpy.uint8)
+    log_probs = numpy.empty(batch_size)
+    epi_pos = numpy.empty(batch_size, dtype=bool)
+    epi_neg = numpy.empty(batch_size, dtype=bool)
+    size = 0
+    for k in itertools.chain([None], adjacent_transpositions(n)):
+        if k is not None:
+            a, b = w[k] - 1, w[k + 1] - 1
+            checker.swap(k)
+            log_prob += finite_log_p[b][a] - finite_log_p[a][b]
+            number_zeros += zero[b][a] - zero[a][b]
+        if size == 0:  # The sum is recomputed at the start of every batch, so that rounding errors do not accumulate.
+            indices = numpy.array(w) - 1
+            log_prob = float(numpy.sum(numpy.where(finite, log_p_ij, 0)[indices[first], indices[second]]))
+            number_zeros = int(numpy.sum(~finite[indices[first], indices[second]]))
+        batch[size] = w
+        log_probs[size] = log_prob if number_zeros == 0 else -numpy.inf
+        epi_pos[size], epi_neg[size] = checker.signs()
+        size += 1
+        if size == batch_size:
+            yield [batch.copy(), rankings_to_ranks(batch), log_probs.copy(), epi_pos.copy(), epi_neg.copy()]
+            size = 0
+    if size > 0:
+        yield [batch[:size], rankings_to_ranks(batch[:size]), log_probs[:size], epi_pos[:size], epi_neg[:size]]
 
 
 # The comparison (competition experiment) model.
 # Returns the probability of epistasis given the trial data.
-def epistasis_probability_from_comparisons(fit_data_list, threshold_prob):
+# The probability of a ranking is \Pi_{i < j} p_{ranking[i], ranking[j]}, computed in log space for batches of
+# batch_size rankings of the permutation table at once; the probabilities of positive and negative epistasis are
+# normalized by the total probability mass, also accumulated in log space.
+# Works for 8 genotypes (total three-way interaction) and, more generally, for 2^L genotypes with L small enough for
+# the table of all rankings (total L-way interaction, genotypes in the order of genotype_space).
+# The returned lists contain [ranking, probability] for all rankings with probability above threshold_prob, in the
+# order of the permutation table (get_next_ordering), for each of positive, negative, and non-informative rankings.
+# If top_k is given, only the top_k most probable ones are kept for each of them, sorted by decreasing probability.
+# If output_file is given, all rankings with probability above threshold_prob are streamed to ./outputs/output_file,
+# one line "ranking log-probability sign" per ranking, sign being +, -, or 0 for non-informative rankings.
+# If method == "walk", the rankings are visited by walk_ranking_batches instead of being read from the table, which
+# then needs not be kept in memory; the results are the same up to rounding, but the rankings are streamed to
+# output_file in the order of the walk.
+def epistasis_probability_from_comparisons(fit_data_list, threshold_prob, top_k=None, output_file=None,
+                                           batch_size=5040, method="table"):
     # Compute probabilities P(W_i < W_j) = p_{i,j}:
-    p_ij = ranking_probabilities(fit_data_list)
-    # Loop through all rankings:
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    ranking = [1, 2, 3, 4, 5, 6, 7, 8]
-    positives = {1, 5, 6, 7}
-    negatives = {4, 3, 2, 8}
-    repetitions = [1, 1, 1, 1, 1, 1, 1, 1]
-    positive_epi_prob = 0
-    negative_epi_prob = 0
-    total_prob_mass = 0
-    positive_rankings = []
-    negative_rankings = []
-    non_informative_rankings = []
-    # Compute the probability of the ranking as \Pi_{i, j} p_{i, j}.
-    rank_prob = 1
-    for j in range(len(ranking)):
-        for i in range(j):
-            rank_prob *= p_ij[ranking[i] - 1][ranking[j] - 1]
-    total_prob_mass += rank_prob
-    if epistasis_positive(ranking, positives, negatives, repetitions):
-        positive_epi_prob += rank_prob
-        if rank_prob > threshold_prob:
-            positive_rankings.append([ranking, rank_prob])
-    elif epistasis_negative(ranking, positives, negatives, repetitions):
-        negative_epi_prob += rank_prob
-        if rank_prob > threshold_prob:
-            negative_rankings.append([ranking, rank_prob])
-    elif rank_prob > threshold_prob:
-        non_informative_rankings.append([ranking, rank_prob])
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        ranking = ordering_to_fitness(ordering)
-        rank_prob = 1
-        for j in range(len(ranking)):
-            for i in range(j):
-                rank_prob *= p_ij[ranking[i] - 1][ranking[j] - 1]
-        total_prob_mass += rank_prob
-        if epistasis_positive(ranking, positives, negatives, repetitions):
-            positive_epi_prob += rank_prob
-            if rank_prob > threshold_prob:
-                positive_rankings.append([ranking, rank_prob])
-        elif epistasis_negative(ranking, positives, negatives, repetitions):
-            negative_epi_prob += rank_prob
-            if rank_prob > threshold_prob:
-                negative_rankings.append([ranking, rank_prob])
-        elif rank_prob > threshold_prob:
-            non_informative_rankings.append([ranking, rank_prob])
-    positive_epi_prob /= total_prob_mass
-    negative_epi_prob /= total_prob_mass
-    # print "Probability of positive epistasis: " + str(positive_epi_prob)
-    # print "Probability of negative epistasis: " + str(negative_epi_prob)
-
-    top_pos_epi_prob = 0
-    for i in range(len(positive_rankings)):
-        top_pos_epi_prob += positive_rankings[i][1]
-    top_neg_epi_prob = 0
-    for i in range(len(negative_rankings)):
-        top_neg_epi_prob += negative_rankings[i][1]
-    top_non_info_prob = 0
-    for i in range(len(non_informative_rankings)):
-        top_non_info_prob += non_informative_rankings[i][1]
+    p_ij = numpy.array(ranking_probabilities(fit_data_list))
+    with numpy.errstate(divide="ignore"):
+        log_p_ij = numpy.log(p_ij)
+        log_threshold = numpy.log(threshold_prob)
+    positives, negatives = get_genotype_space(number_of_loci(len(fit_data_list))).total_interaction()
+    repetitions = [1] * len(fit_data_list)
+    # Running log-probabilities and top rankings of the three classes: positive, negative, non-informative.
+    log_mass = [-numpy.inf, -numpy.inf, -numpy.inf]
+    log_top_mass = [-numpy.inf, -numpy.inf, -numpy.inf]
+    top_numbers = [0, 0, 0]
+    heaps = [[], [], []]
+    if output_file is not None:
+        rankings_file = open("./outputs/%s" % output_file, "w")
+    ranking_batches = walk_ranking_batches if method == "walk" else table_ranking_batches
+    for batch, ranks, log_probs, epi_pos, epi_neg in ranking_batches(log_p_ij, positives, negatives, repetitions,
+                                                                     batch_size):
+        classes = numpy.where(epi_pos, 0, numpy.where(epi_neg, 1, 2))
+        above = log_probs > log_threshold
+        for c in range(3):
+            in_class = classes == c
+            log_mass[c] = numpy.logaddexp(log_mass[c], numpy.logaddexp.reduce(log_probs[in_class]))
+            top = numpy.flatnonzero(in_class & above)
+            top_numbers[c] += len(top)
+            log_top_mass[c] = numpy.logaddexp(log_top_mass[c], numpy.logaddexp.reduce(log_probs[top]))
+            push_top_rankings(heaps[c], log_probs[top], ranks[top], batch[top], top_k)
+        if output_file is not None:
+            top = numpy.flatnonzero(above)
+            signs = numpy.array(["+", "-", "0"])[classes[top]]
+            rankings_file.write("".join(["%s %r %s\n" % (ranking, log_prob, sign) for ranking, log_prob, sign in
+                                         zip(batch[top].tolist(), log_probs[top].tolist(), signs)]))
+    if output_file is not None:
+        rankings_file.close()
+    log_total_mass = numpy.logaddexp.reduce(log_mass)
+    positive_epi_prob = float(numpy.exp(log_mass[0] - log_total_mass))
+    negative_epi_prob = float(numpy.exp(log_mass[1] - log_total_mass))
+    if top_k is None:  # In the order of ranks.
+        heaps = [sorted(heap, key=lambda entry: entry[1]) for heap in heaps]
+    else:
+        heaps = [sorted(heap, reverse=True) for heap in heaps]
+    positive_rankings, negative_rankings, non_informative_rankings = \
+        [[[ranking, float(numpy.exp(log_prob))] for log_prob, rank, ranking in heap] for heap in heaps]
+
     print("Threshold probability: " + str(threshold_prob))
     print("Top rankings with positive epistasis: " + str(positive_rankings))
-    print(str(len(positive_rankings)) + " in total")
-    print("With total probability: " + str(top_pos_epi_prob))
+    print(str(top_numbers[0]) + " in total")
+    print("With total probability: " + str(float(numpy.exp(log_top_mass[0]))))
     print("Top rankings with negative epistasis: " + str(negative_rankings))
-    print(str(len(negative_rankings)) + " in total")
-    print("With total probability: " + str(top_neg_epi_prob))
+    print(str(top_numbers[1]) + " in total")
+    print("With total probability: " + str(float(numpy.exp(log_top_mass[1]))))
     print("Top non-informative rankings: " + str(non_informative_rankings))
-    print(str(len(non_informative_rankings)) + " in total")
-    print("With total probability: " + str(top_non_info_prob) + "\n")
+    print(str(top_numbers[2]) + " in total")
+    print("With total probability: " + str(float(numpy.exp(log_top_mass[2]))) + "\n")
     return [[positive_epi_prob, negative_epi_prob],
             [positive_rankings, negative_rankings, non_informative_rankings]]
 
 
+# Returns the array of all sums of one trial from each list of trial_lists, the sums being taken from left to right.
+def half_sums(trial_lists):
+    sums = numpy.asarray(trial_lists[0], dtype=float)
+    for trials in trial_lists[1:]:
+        sums = numpy.add.outer(sums, numpy.asarray(trials, dtype=float)).ravel()
+    return sums
+
+
 # Returns the probability of positive and negative epistasis from the fitness measurements.
-def epistasis_from_values(fit_data_list):
-    epi_pos = epi_neg = total_count = 0
-    for w0 in range(len(fit_data_list[0])):
-        for w1 in range(len(fit_data_list[1])):
-            for w2 in range(len(fit_data_list[2])):
-                for w3 in range(len(fit_data_list[3])):
-                    for w4 in range(len(fit_data_list[4])):
-                        for w5 in range(len(fit_data_list[5])):
-                            for w6 in range(len(fit_data_list[6])):
-                                for w7 in range(len(fit_data_list[7])):
-                                    total_count += 1
-                                    e = (fit_data_list[0][w0] + fit_data_list[4][w4] + fit_data_list[5][w5] +
-                                         fit_data_list[6][w6]) - \
-                                        (fit_data_list[1][w1] + fit_data_list[2][w2] + fit_data_list[3][w3] +
-                                         fit_data_list[7][w7])
-                                    if e > 0:
-                                        epi_pos += 1
-                                    elif e < 0:
-                                        epi_neg += 1
+# Every combination of one trial per genotype gives
+# e = (w_000 + w_011 + w_101 + w_110) - (w_001 + w_010 + w_100 + w_111), and e > 0 iff the positive half-sum is
+# greater than the negative half-sum. So instead of looping through all combinations, all half-sums are computed
+# (meet in the middle), the positive ones sorted, and the numbers of positive half-sums above and below every negative
+# half-sum found by binary search. This gives the exact counts.
+# If the number of half-sums exceeds max_half_size, the counts are estimated from number_samples random combinations,
+# in which case total_count is number_samples.
+def epistasis_from_values(fit_data_list, max_half_size=10 ** 7, number_samples=10 ** 6, seed=None):
+    positive_lists = [fit_data_list[0], fit_data_list[4], fit_data_list[5], fit_data_list[6]]
+    negative_lists = [fit_data_list[1], fit_data_list[2], fit_data_list[3], fit_data_list[7]]
+    positive_size = numpy.prod([len(trials) for trials in positive_lists], dtype=object)
+    negative_size = numpy.prod([len(trials) for trials in negative_lists], dtype=object)
+    if max(positive_size, negative_size) <= max_half_size:
+        positive_sums = numpy.sort(half_sums(positive_lists))
+        negative_sums = half_sums(negative_lists)
+        epi_pos = int(numpy.sum(positive_size - numpy.searchsorted(positive_sums, negative_sums, side="right")))
+        epi_neg = int(numpy.sum(numpy.searchsorted(positive_sums, negative_sums, side="left")))
+        total_count = int(positive_size * negative_size)
+    else:
+        epi_pos, epi_neg = epistasis_from_values_monte_carlo(positive_lists, negative_lists, number_samples, seed)
+        total_count = number_samples
     epi_pos_prob = epi_pos / float(total_count)
     epi_neg_prob = epi_neg / float(total_count)
     return [epi_pos_prob, epi_neg_prob, epi_pos, epi_neg, total_count]
 
 
+# Returns the numbers [epi_pos, epi_neg] of positive and negative e among number_samples random combinations of one
+# trial per genotype (see epistasis_from_values), sampled in batches of batch_size.
+def epistasis_from_values_monte_carlo(positive_lists, negative_lists, number_samples, seed=None, batch_size=10 ** 5):
+    rng = numpy.random.default_rng(seed)
+    positive_lists = [numpy.asarray(trials, dtype=float) for trials in positive_lists]
+    negative_lists = [numpy.asarray(trials, dtype=float) for trials in negative_lists]
+    epi_pos = epi_neg = 0
+    for start in range(0, number_samples, batch_size):
+        batch = min(batch_size, number_samples - start)
+        positive_sums = sum([trials[rng.integers(0, len(trials), batch)] for trials in positive_lists])
+        negative_sums = sum([trials[rng.integers(0, len(trials), batch)] for trials in negative_lists])
+        epi_pos += int(numpy.sum(positive_sums > negative_sums))
+        epi_neg += int(numpy.sum(positive_sums < negative_sums))
+    return [epi_pos, epi_neg]
+
+
 # Returns k closest entries to the mean for each component of fit_data_list:
 def closest_to_mean(fit_data_list, k, mean_type="mean"):
     if mean_type == "mean":
@@ -159,47 +251,9 @@ def closest_to_mean(fit_data_list, k, mean_type="mean"):
 
 
 # Returns the list of lists of fitness values for the eight genotypes corresponding to the hard-coded mutations:
-def datafile_hiv_process():
-    data_file = "2007_HIV_data.csv"
-    mutations = [["L", "M"],  # mutations: L to M, M to V, t to Y
-                 ["M", "V"],
-                 ["t", "Y"]]
-    sites = [88, 244, 275]  # sites: PRO L90M, RT M184V, RT T215Y
-    sites = [0] + [1] + sites  # This is specific to the data file. Column 0 contains fitness, column 1 names.
-    values = pandas.read_csv(data_file, usecols=sites)
-    values.iloc[:, 0] = numpy.log10(values.iloc[:, 0])  # log10 scale of fitness values.
-    size = len(values.iloc[:, 1])
-    f000 = []
-    f001 = []
-    f010 = []
-    f100 = []
-    f011 = []
-    f101 = []
-    f110 = []
-    f111 = []
-    for m in range(size):
-        if (values.iloc[m, 2] == mutations[0][0]) & (values.iloc[m, 3] == mutations[1][0]) & \
-                (values.iloc[m, 4] == mutations[2][0]):
-            f000.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][0]) & (values.iloc[m, 3] == mutations[1][0]) & \
-                (values.iloc[m, 4] == mutations[2][1]):
-            f001.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][0]) & (values.iloc[m, 3] == mutations[1][1]) & \
-                (values.iloc[m, 4] == mutations[2][0]):
-            f010.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][1]) & (values.iloc[m, 3] == mutations[1][0]) & \
-                (values.iloc[m, 4] == mutations[2][0]):
-            f100.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][0]) & (values.iloc[m, 3] == mutations[1][1]) & \
-                (values.iloc[m, 4] == mutations[2][1]):
-            f011.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][1]) & (values.iloc[m, 3] == mutations[1][0]) & \
-                (values.iloc[m, 4] == mutations[2][1]):
-            f101.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][1]) & (values.iloc[m, 3] == mutations[1][1]) & \
-                (values.iloc[m, 4] == mutations[2][0]):
-            f110.append(values.iloc[m, 0])
-        elif (values.iloc[m, 2] == mutations[0][1]) & (values.iloc[m, 3] == mutations[1][1]) & \
-                (values.iloc[m, 4] == mutations[2][1]):
-            f111.append(values.iloc[m, 0])
-    return [f000, f001, f010, f100, f011, f101, f110, f111]
+# The data file is parsed by fitness_landscape.landscape_from_sites_csv, which works for any sites and mutations.
+def datafile_hiv_process(data_file="2007_HIV_data.csv", cache_file=None):
+    sites = [[88, "L", "M"],  # sites: PRO L90M, RT M184V, RT T215Y; mutations: L to M, M to V, t to Y
+             [244, "M", "V"],
+             [275, "t", "Y"]]  # This is specific to the data file. Column 0 contains fitness, column 1 names.
+    return landscape_to_lists(landscape_from_sites_csv(data_file, sites, 0, True, cache_file))
@@ -1,6 +1,6 @@
-import random
 from models_HIV_2007 import datafile_hiv_process
-from three_way_epistasis import epistasis_positive, epistasis_negative
+from three_way_epistasis import epistasis_positive, epistasis_negative, EpistasisChecker
+from genotype_space import get_genotype_space, number_of_loci
 import numpy
 
 __author__ = '@gavruskin'
@@ -10,26 +10,30 @@ __author__ = '@gavruskin'
 # generates n samples of pairwise comparisons of fitness.
 # The output is a matrix with i,j being the number of times i has higher fitness than j.
 # w_000 = w[0], w_001 = w[1], w_010 = w[2], w_100 = w[3], w_011 = w[4], w_101 = w[5], w_110 = w[6], w_111 = w[7]:^
-def sample_ranks_randomly(fit_data_list, n):
-    output = [[0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0],
-              [0, 0, 0, 0, 0, 0, 0, 0]]
-    for sample in range(n):
-        for i in range(8):
-            for j in range(8):
-                if i != j:
-                    f_i_rand = random.randint(0, len(fit_data_list[i]) - 1)
-                    f_j_rand = random.randint(0, len(fit_data_list[j]) - 1)
-                    if fit_data_list[i][f_i_rand] > fit_data_list[j][f_j_rand]:
-                        output[i][j] += 1
-                    elif fit_data_list[i][f_i_rand] < fit_data_list[j][f_j_rand]:
-                        output[j][i] += 1
-    return output
+# Works for any number of genotypes (e.g. 2^L). In every sample, each ordered pair (i, j), i != j, compares a random
+# replicate of i with a random replicate of j. The replicate indices of chunk_size samples at a time are drawn at once
+# with the NumPy generator seeded by seed, so that memory stays bounded for large n (e.g. 10^6).
+def sample_ranks_randomly(fit_data_list, n, seed=None, chunk_size=None):
+    rng = numpy.random.default_rng(seed)
+    number_genotypes = len(fit_data_list)
+    sizes = numpy.array([len(trials) for trials in fit_data_list])
+    padded = numpy.zeros([number_genotypes, max(sizes)])  # Row i holds the replicates of i followed by 0's.
+    for i in range(number_genotypes):
+        padded[i, :sizes[i]] = fit_data_list[i]
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 20 // number_genotypes ** 2)
+    rows = numpy.arange(number_genotypes)[:, None]
+    columns = numpy.arange(number_genotypes)[None, :]
+    off_diagonal = rows != columns
+    output = numpy.zeros([number_genotypes, number_genotypes], dtype=numpy.int64)
+    for start in range(0, n, chunk_size):
+        chunk = min(chunk_size, n - start)
+        shape = (chunk, number_genotypes, number_genotypes)
+        f_i = padded[rows, rng.integers(0, sizes[:, None], size=shape)]  # f_i[sample, i, j] is a replicate of i.
+        f_j = padded[columns, rng.integers(0, sizes[None, :], size=shape)]  # f_j[sample, i, j] is a replicate of j.
+        output += numpy.sum((f_i > f_j) & off_diagonal, axis=0)
+        output += numpy.sum((f_i < f_j) & off_diagonal, axis=0).T
+    return output.tolist()
 
 
 def simulate_competition_experiment_from_hiv_data():
@@ -64,3 +68,121 @@ def get_epistasis_from_top_10_maxlik_rankings():
         print("Positive epistasis: " + str(epistasis_positive(g[i], positives, negatives, repetitions)))
         print("Negative epistasis: " + str(epistasis_negative(g[i], positives, negatives, repetitions)))
         print("\n")
+
+
+# Returns the matrix p_ij = P(W_i < W_j) (as in models_HIV_2007.ranking_probabilities) estimated from the win matrix
+# returned by sample_ranks_randomly, win_matrix[i][j] being the number of times i has higher fitness than j.
+# pseudocount is added to both counts of every pair, so that no probability is 0.
+def win_probabilities(win_matrix, pseudocount=1):
+    wins = numpy.asarray(win_matrix, dtype=float)
+    p_ij = (wins.T + pseudocount) / (wins + wins.T + 2 * pseudocount)
+    numpy.fill_diagonal(p_ij, 0)
+    return p_ij
+
+
+# Returns the top k most likely rankings under the pairwise comparison model of
+# models_HIV_2007.epistasis_probability_from_comparisons: P(ranking) is proportional to \Pi_{i < j} p_{w_i, w_j},
+# where p_ij = P(W_i < W_j) is given (e.g. by ranking_probabilities) or estimated from win_matrix (win_probabilities).
+# The output is the list of [ranking, log \Pi_{i < j} p_{w_i, w_j}] sorted by decreasing probability, rankings being
+# from the least fit to the fittest genotype (numbered from 1), as everywhere in the package.
+# Up to max_exact genotypes, the rankings are exact: dynamic programming over the sets S of the fittest genotypes keeps
+# the k best orders of every S, adding the next genotype v below S at the cost \sum_{u in S} log p_vu.
+# Above max_exact genotypes, beam search keeps the beam_width (by default 100 * k) best partial rankings instead.
+def top_rankings(win_matrix=None, k=10, p_ij=None, max_exact=16, beam_width=None):
+    if p_ij is None:
+        p_ij = win_probabilities(win_matrix)
+    with numpy.errstate(divide="ignore"):
+        cost = numpy.log(numpy.asarray(p_ij, dtype=float)).T  # cost[u, v] = log P(W_v < W_u): u is above v.
+    n = len(cost)
+    if n > max_exact:
+        return top_rankings_beam(cost, k, beam_width if beam_width is not None else 100 * k)
+    number_sets = 2 ** n
+    # below[S, v] = \sum_{u in S} cost[u, v], computed from the sets without the highest element u:
+    below = numpy.zeros([number_sets, n])
+    for u in range(n):
+        below[2 ** u:2 ** (u + 1)] = below[:2 ** u] + cost[u]
+    # scores[S] are the k best scores of orders of S (from the top), parents[S] and last[S] the backtracking data.
+    scores = numpy.full([number_sets, k], -numpy.inf)
+    parents = numpy.zeros([number_sets, k, 2], dtype=numpy.int64)  # [set without the last genotype, slot].
+    last = numpy.zeros([number_sets, k], dtype=numpy.int64)
+    scores[0, 0] = 0
+    popcounts = numpy.array([bin(s).count("1") for s in range(number_sets)])
+    for size in range(n):
+        layer = numpy.flatnonzero(popcounts == size)
+        candidate_sets = []
+        candidate_scores = []
+        candidate_parents = []
+        candidate_slots = []
+        candidate_last = []
+        for v in range(n):
+            free = layer[layer & (1 << v) == 0]
+            new_scores = scores[free] + below[free, v][:, None]
+            candidate_sets.append(numpy.repeat(free | (1 << v), k))
+            candidate_scores.append(new_scores.ravel())
+            candidate_parents.append(numpy.repeat(free, k))
+            candidate_slots.append(numpy.tile(numpy.arange(k), len(free)))
+            candidate_last.append(numpy.full(len(free) * k, v))
+        candidate_sets = numpy.concatenate(candidate_sets)
+        candidate_scores = numpy.concatenate(candidate_scores)
+        order = numpy.lexsort((-candidate_scores, candidate_sets))
+        ordered_sets = candidate_sets[order]
+        first = numpy.searchsorted(ordered_sets, ordered_sets, side="left")
+        slots = numpy.arange(len(order)) - first  # The position of the candidate among those of the same set.
+        keep = slots < k
+        chosen = order[keep]
+        targets = ordered_sets[keep]
+        scores[targets, slots[keep]] = candidate_scores[chosen]
+        parents[targets, slots[keep], 0] = numpy.concatenate(candidate_parents)[chosen]
+        parents[targets, slots[keep], 1] = numpy.concatenate(candidate_slots)[chosen]
+        last[targets, slots[keep]] = numpy.concatenate(candidate_last)[chosen]
+    output = []
+    full = number_sets - 1
+    for slot in range(k):
+        if scores[full, slot] == -numpy.inf:
+            break
+        ranking = []
+        current_set, current_slot = full, slot
+        while current_set != 0:
+            ranking.append(int(last[current_set, current_slot]) + 1)  # From the least fit upwards.
+            current_set, current_slot = parents[current_set, current_slot]
+        output.append([ranking, float(scores[full, slot])])
+    return output
+
+
+# Beam search version of top_rankings for the matrix cost[u, v] = log P(W_v < W_u): rankings are built from the fittest
+# genotype down, keeping the beam_width partial rankings with the highest scores.
+def top_rankings_beam(cost, k, beam_width):
+    n = len(cost)
+    beam = [[0.0, []]]
+    for step in range(n):
+        candidates = []
+        for score, order in beam:
+            placed = cost[order].sum(axis=0) if order else numpy.zeros(n)
+            for v in range(n):
+                if v not in order:
+                    candidates.append([score + placed[v], order + [v]])
+        candidates.sort(key=lambda candidate: -candidate[0])
+        beam = candidates[:max(beam_width, k)]
+    return [[[v + 1 for v in reversed(order)], float(score)] for score, order in beam[:k]]
+
+
+# Prints and returns the top k maximum likelihood rankings (see top_rankings) of the win matrix of number_samples
+# simulated competition experiments (sample_ranks_randomly) from fit_data_list (the HIV data by default), each with
+# the signs of the total interaction (e.g. three-way for 8 genotypes) it implies, as [ranking, log-probability,
+# positive, negative].
+def get_epistasis_from_top_k_maxlik_rankings(fit_data_list=None, k=10, number_samples=1000, seed=None):
+    if fit_data_list is None:
+        fit_data_list = datafile_hiv_process()
+    rankings = top_rankings(sample_ranks_randomly(fit_data_list, number_samples, seed), k)
+    positives, negatives = get_genotype_space(number_of_loci(len(fit_data_list))).total_interaction()
+    checker = EpistasisChecker(positives, negatives, [1] * len(fit_data_list))
+    output = []
+    for ranking, log_prob in rankings:
+        epi_pos, epi_neg = checker.check(ranking)
+        print(ranking)
+        print("Log-likelihood: " + str(log_prob))
+        print("Positive epistasis: " + str(epi_pos))
+        print("Negative epistasis: " + str(epi_neg))
+        print("\n")
+        output.append([ranking, log_prob, epi_pos, epi_neg])
+    return output
@@ -1,23 +1,54 @@
-from scipy.stats import ranksums
+from scipy.stats import ranksums, norm
+import functools
 import math
 import sys
 import numpy as np
-from conditional_and_marginal_epistasis import genotype_look_good
+from fitness_landscape import FitnessLandscape
 
 
 __author__ = "@gavruskin"
 
 
+# Returns [z, p], the matrices of the Wilcoxon rank-sum test statistics and two-sided p-values of all pairs of vectors
+# of measurements, z[i][j] and p[i][j] being equal to ranksums(measurements[i], measurements[j]).
+# Instead of re-ranking the two samples of every pair, every sample is sorted once and the Mann-Whitney statistics
+# U[i][j] = #{(x, y) : x > y} + #{(x, y) : x == y} / 2, x in sample i and y in sample j, are counted by binary search.
+# The rank sum of sample i in the pair is U[i][j] + n_i (n_i + 1) / 2, which gives z as in ranksums (no tie correction).
+def rank_sum_statistics(measurements):
+    samples = [np.asarray(sample, dtype=float) for sample in measurements]
+    sizes = np.array([len(sample) for sample in samples], dtype=float)
+    values = np.concatenate(samples)
+    starts = np.concatenate([[0], np.cumsum(sizes[:-1])]).astype(int)
+    u = np.empty([len(samples), len(samples)])
+    for j in range(len(samples)):
+        sample_j = np.sort(samples[j])
+        below = np.searchsorted(sample_j, values, side="left")
+        at_most = np.searchsorted(sample_j, values, side="right")
+        u[:, j] = np.add.reduceat((below + at_most) / 2.0, starts)  # #{y < x} + #{y == x} / 2 summed over x in i.
+    sizes_i = sizes[:, None]
+    sizes_j = sizes[None, :]
+    z = (u - sizes_i * sizes_j / 2) / np.sqrt(sizes_i * sizes_j * (sizes_i + sizes_j + 1) / 12)
+    p = 2 * norm.sf(np.abs(z))
+    return [z, p]
+
+
+# Returns the order of the indices of samples (from 0) from the fittest to the least fit according to the matrix z of
+# rank-sum statistics (see rank_sum_statistics): i comes after j if z[i][j] < 0.
+# The indices are sorted by a stable comparison sort, so that samples with z == 0 keep their order.
+def rank_sum_order(z):
+    def compare(i, j):
+        if z[i][j] < 0:
+            return 1
+        if z[i][j] > 0:
+            return -1
+        return 0
+    return sorted(range(len(z)), key=functools.cmp_to_key(compare))
+
+
 # Returns the ordering of vectors of measurements according to Wilcoxon rank-sum test:
 def rank_sum_3_sites(measurements, details=False):
-    output = [1, 2, 3, 4, 5, 6, 7, 8]
-    done = False
-    while not done:
-        done = True
-        for i in range(len(measurements) - 1):
-            if ranksums(measurements[output[i] - 1], measurements[output[i+1] - 1])[0] < 0:
-                output[i], output[i+1] = output[i+1], output[i]
-                done = False
+    z = rank_sum_statistics(measurements)[0]
+    output = [index + 1 for index in rank_sum_order(z)]
     if details:
         for i in range(len(measurements) - 1):
             print(ranksums(measurements[output[i] - 1], measurements[output[i + 1] - 1]))
@@ -26,36 +57,23 @@ def rank_sum_3_sites(measurements, details=False):
 
 # Does the same thing as rank_sum_3_sites but for an arbitrary number of sites.
 # Unlike rank_sum_3_sites, produce the ranking of genotypes---not their indices.
-# Unlike rank_sum_3_sites, takes a dictionary, where measurements["genotype"] == list of fitnesses, as an input.
+# Unlike rank_sum_3_sites, takes a dictionary, where measurements["genotype"] == list of fitnesses, or a
+# FitnessLandscape (without the missing measurements), as an input.
 # If details == True, returns a dictionary of genotypes with their mean fitnesses, *ordered by mean fitnesses*.
 def rank_sum_n_sites(measurements, details=False):
+    if isinstance(measurements, FitnessLandscape):
+        measurements = dict([[genotype, [value for value in trials if value is not None]]
+                             for genotype, trials in measurements.to_dict().items()])
     if math.frexp(len(measurements))[0] != 0.5:
         print("rank_sum_n_sites received an input of length %s, which is not equal to the number of genotypes."
               "Quitting." % len(measurements))
         sys.exit()
-    output_indices = []
-    for genotype in measurements:
-        output_indices.append(measurements.keys().index(genotype))
-    done = False
-    while not done:
-        done = True
-        for i in range(len(measurements) - 1):
-            if ranksums(measurements[measurements.keys()[output_indices[i]]],
-                        measurements[measurements.keys()[output_indices[i+1]]])[0] < 0:
-                output_indices[i], output_indices[i + 1] = output_indices[i + 1], output_indices[i]
-                done = False
-    output = []
-    output_look_good = []
-    number_loci = 0
-    for index in output_indices:
-        output.append(measurements.keys()[index])
-        if len(measurements.keys()[index]) > number_loci:
-            number_loci = len(measurements.keys()[index])
-    for index in output_indices:
-        output_look_good.append(genotype_look_good(measurements.keys()[index], number_loci))
+    genotypes = list(measurements.keys())
+    z = rank_sum_statistics([measurements[genotype] for genotype in genotypes])[0]
+    output = [genotypes[index] for index in rank_sum_order(z)]
     output_detailed = []
     for genotype in output:
-        fitness = measurements[genotype][1:]
+        fitness = list(measurements[genotype])[1:]
         output_detailed.append([genotype, np.mean(fitness)])
     if not details:
         return output
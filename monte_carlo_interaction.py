@@ -0,0 +1,141 @@
+import math
+from statistics import NormalDist
+import numpy as np
+from permutation_table import epistasis_masks
+from partial_order_interaction import total_extensions
+from genotype_space import get_genotype_space
+
+__author__ = "@gavruskin"
+
+
+# Monte Carlo estimates of the fraction of rankings that imply positive or negative interaction, for the cases when the
+# rankings cannot be enumerated (e.g. 16! rankings for four loci).
+# Rankings are sampled in batches as NumPy arrays, either uniformly from all rankings or uniformly from the total
+# extensions of a partial order, and the sampling stops when the confidence intervals are narrow enough.
+# Example of usage for the four-way interaction u_1111 (genotypes in binary order as in four_way_interactions):
+# estimate_four_way_fractions(1111, target_error=0.001, seed=1)
+
+
+# Returns a (number_samples, n) array of uniformly random rankings of {1, ..., n}.
+def sample_rankings(n, number_samples, rng):
+    dtype = np.uint8 if n < 256 else np.uint16
+    rankings = np.tile(np.arange(1, n + 1, dtype=dtype), (number_samples, 1))
+    return rng.permuted(rankings, axis=1)
+
+
+# Markov chain on the total extensions of a partial order (Bubley and Dyer; Karzanov and Khachiyan), run on
+# number_chains independent copies at once.
+# As in total_extensions, an edge [a, b] of graph means that b comes before a.
+# A step picks a random adjacent pair of positions in every chain and, with probability 1/2, swaps the two elements
+# unless the partial order forbids it. The chain is symmetric, so its stationary distribution is uniform.
+class TotalExtensionsChain:
+    def __init__(self, graph, number_chains, rng, number_elements=None, number_steps=None):
+        start = next(total_extensions(graph, number_elements), None)
+        if start is None:
+            raise ValueError("The partial order has no total extensions (it contains a cycle).")
+        self.n = len(start)
+        self.rng = rng
+        self.forbidden = np.zeros((self.n + 1, self.n + 1), dtype=bool)  # forbidden[a, b]: a can't come after b.
+        for edge in graph:
+            self.forbidden[edge[1], edge[0]] = True
+        if number_steps is None:  # Of the order of the mixing time n^3 log(n).
+            number_steps = int(self.n ** 3 * max(1.0, math.log(self.n)))
+        self.number_steps = number_steps
+        dtype = np.uint8 if self.n < 256 else np.uint16
+        self.states = np.tile(np.array(start, dtype=dtype), (number_chains, 1))
+        self.run(self.number_steps)  # Burn-in.
+
+    # Advances all chains by number_steps steps.
+    # Random positions and coins are drawn for blocks of steps at once, and the states are updated through a flat view.
+    def run(self, number_steps, block_size=64):
+        number_chains = len(self.states)
+        flat_states = self.states.reshape(-1)
+        offsets = np.arange(number_chains) * self.n
+        for block_start in range(0, number_steps, block_size):
+            block = min(block_size, number_steps - block_start)
+            positions = self.rng.integers(0, self.n - 1, size=(block, number_chains)) + offsets
+            coins = self.rng.random((block, number_chains)) < 0.5
+            for step in range(block):
+                left_positions = positions[step][coins[step]]
+                left = flat_states[left_positions]
+                right = flat_states[left_positions + 1]
+                allowed = ~self.forbidden[left, right]
+                left_positions = left_positions[allowed]
+                flat_states[left_positions] = right[allowed]
+                flat_states[left_positions + 1] = left[allowed]
+
+    # Advances the chains by number_steps and returns a copy of their states as a batch of samples.
+    def sample(self):
+        self.run(self.number_steps)
+        return self.states.copy()
+
+
+# Returns the Wilson score interval [lower, upper] for count successes out of number trials.
+def wilson_interval(count, number, confidence=0.95):
+    if number == 0:
+        return [0.0, 1.0]
+    z = NormalDist().inv_cdf((1 + confidence) / 2.0)
+    fraction = count / float(number)
+    denominator = 1 + z ** 2 / number
+    center = (fraction + z ** 2 / (2 * number)) / denominator
+    half_width = z * math.sqrt(fraction * (1 - fraction) / number + z ** 2 / (4 * number ** 2)) / denominator
+    return [max(0.0, center - half_width), min(1.0, center + half_width)]
+
+
+# Estimates the fractions of rankings that imply positive and negative interaction for the circuit given by positives,
+# negatives, and repetitions (as in epistasis_positive), among all rankings of n elements if graph is None and among
+# the total extensions of graph (see total_extensions) otherwise.
+# Samples are drawn in batches of batch_size until both confidence intervals have half-width at most target_error,
+# or max_samples is reached.
+# Returns [[positive fraction, lower, upper], [negative fraction, lower, upper], number of samples], with a ranking
+# counted as negative only if it does not imply positive interaction (as in list_epistasis_signed).
+def estimate_interaction_fractions(positives, negatives, repetitions=None, n=None, graph=None, target_error=0.005,
+                                   confidence=0.95, batch_size=10000, max_samples=10 ** 7, seed=None,
+                                   number_steps=None):
+    rng = np.random.default_rng(seed)
+    if n is None:
+        n = max(max(positives), max(negatives))
+    if repetitions is None:
+        repetitions = [1] * n
+    chain = None
+    if graph is not None:
+        chain = TotalExtensionsChain(graph, batch_size, rng, n, number_steps)
+    number_samples = 0
+    number_positive = 0
+    number_negative = 0
+    while number_samples < max_samples:
+        if chain is None:
+            rankings = sample_rankings(n, min(batch_size, max_samples - number_samples), rng)
+        else:
+            rankings = chain.sample()[:max_samples - number_samples]
+        epi_pos, epi_neg = epistasis_masks(rankings, positives, negatives, repetitions)
+        number_samples += len(rankings)
+        number_positive += int(np.sum(epi_pos))
+        number_negative += int(np.sum(epi_neg & ~epi_pos))
+        positive_interval = wilson_interval(number_positive, number_samples, confidence)
+        negative_interval = wilson_interval(number_negative, number_samples, confidence)
+        half_width = max(positive_interval[1] - positive_interval[0], negative_interval[1] - negative_interval[0]) / 2
+        if half_width <= target_error:
+            break
+    return [[number_positive / float(number_samples)] + positive_interval,
+            [number_negative / float(number_samples)] + negative_interval,
+            number_samples]
+
+
+# Estimates the fractions of rankings of the 16 genotypes on four loci (enumerated in binary order, as in
+# four_way_interactions) that imply positive and negative interaction for the interaction coordinate u, e.g. 1111.
+# The remaining arguments are as in estimate_interaction_fractions.
+def estimate_four_way_fractions(u=1111, graph=None, target_error=0.005, confidence=0.95, batch_size=10000,
+                                max_samples=10 ** 7, seed=None):
+    positives, negatives = get_genotype_space(4, "binary").interaction_coordinate(u)
+    return estimate_interaction_fractions(positives, negatives, None, 16, graph, target_error, confidence, batch_size,
+                                          max_samples, seed)
+
+
+# The same as estimate_four_way_fractions for the total number_loci-way interaction, as in total_n_way_interaction.
+def estimate_total_n_way_fractions(number_loci, graph=None, target_error=0.005, confidence=0.95, batch_size=10000,
+                                   max_samples=10 ** 7, seed=None):
+    space = get_genotype_space(number_loci, "binary")
+    positives, negatives = space.total_interaction()
+    return estimate_interaction_fractions(positives, negatives, None, space.size, graph, target_error, confidence,
+                                          batch_size, max_samples, seed)
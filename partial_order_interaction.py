@@ -1,111 +1,441 @@
 import os.path
 import sys
-from three_way_epistasis import get_next_ordering, ordering_to_fitness, epistasis_positive, epistasis_negative
+import json
+import collections
+import shelve
+import numpy
+import multiprocessing
+from multiprocessing import shared_memory
+from three_way_epistasis import EpistasisChecker
 from circuit_epistasis import get_repetitions_from_circuit_number, get_positives_list, get_negatives_list
+from permutation_table import get_all_rankings, rankings_to_ranks, consistent_mask, get_positions, epistasis_masks
+from genotype_space import get_genotype_space, number_of_loci
+from ranks_to_graph import cube_symmetries
 
 __author__ = "@gavruskin"
 
 
 # Given a partial order in the form of adjacency lists, return all total extensions.
-# Loops through all total orders looking for compatible ones.
+# Filters the table of all total orders (permutation_table) looking for compatible ones.
 def all_total_extensions_brute_force(graph):
-    output = []
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = [1, 2, 3, 4, 5, 6, 7, 8]
-    compatible = True
+    rankings = get_all_rankings(8)
+    reversed_graph = [[edge[1], edge[0]] for edge in graph]  # The less fit genotype comes last.
+    return rankings[consistent_mask(rankings, reversed_graph)].tolist()
+
+
+# Given a partial order in the form of adjacency lists, yields its total extensions one by one.
+# As in all_total_extensions_brute_force, an edge [a, b] means that a is less fit than b, so b comes before a in every
+# total extension. The elements are 1, ..., number_elements (by default, 8 or the largest element of graph).
+# Backtracking topological sort: the next element is chosen among those whose fitter elements are already placed,
+# hence every branch ends with a total extension and the running time is proportional to the output.
+# If graph contains a cycle, nothing is yielded.
+def total_extensions(graph, number_elements=None):
+    if number_elements is None:
+        number_elements = max([8] + [max(edge) for edge in graph])
+    less_fit = [set() for _ in range(number_elements + 1)]  # less_fit[b] is the set of a with edge [a, b].
+    for edge in graph:
+        less_fit[edge[1]].add(edge[0])
+    blockers = [0] * (number_elements + 1)  # The number of not yet placed elements that must precede a.
+    for b in range(1, number_elements + 1):
+        for a in less_fit[b]:
+            blockers[a] += 1
+    available = [a for a in range(1, number_elements + 1) if blockers[a] == 0]
+    # Check for cycles first, so that the search below never ends up in a dead end.
+    sorted_number = 0
+    queue = list(available)
+    remaining = list(blockers)
+    while queue:
+        b = queue.pop()
+        sorted_number += 1
+        for a in less_fit[b]:
+            remaining[a] -= 1
+            if remaining[a] == 0:
+                queue.append(a)
+    if sorted_number < number_elements:
+        return
+    for output in _extend([], available, less_fit, blockers, number_elements):
+        yield output
+
+
+# Recursive step of total_extensions: extends the prefix extension by every available element in turn.
+def _extend(extension, available, less_fit, blockers, number_elements):
+    if len(extension) == number_elements:
+        yield list(extension)
+        return
+    for i in range(len(available)):
+        b = available[i]
+        extension.append(b)
+        next_available = available[:i] + available[i + 1:]
+        for a in less_fit[b]:
+            blockers[a] -= 1
+            if blockers[a] == 0:
+                next_available.append(a)
+        for output in _extend(extension, next_available, less_fit, blockers, number_elements):
+            yield output
+        for a in less_fit[b]:
+            blockers[a] += 1
+        extension.pop()
+
+
+# Returns the list of all total extensions of graph (see total_extensions) in the order of
+# all_total_extensions_brute_force, that is, sorted by their ranks in permutation_table.
+def all_total_extensions(graph, number_elements=None):
+    output = list(total_extensions(graph, number_elements))
+    if not output:
+        return output
+    order = numpy.argsort(rankings_to_ranks(output), kind="stable")
+    return [output[i] for i in order]
+
+
+# Given a partial order as in total_extensions, returns [number of total extensions, number of those that imply
+# positive interaction, number of those that imply negative (and not positive) interaction] for the circuit given by
+# positives, negatives, and repetitions (by default, the three-way interaction u_111), without enumerating the
+# total extensions.
+# Dynamic programming over the downsets of the partial order: a downset is the set of elements placed first in a total
+# extension (as a bit mask), and the number of extensions of every downset is carried together with the state of the
+# sign test, which is whether the positive and the negative interaction are still possible (see EpistasisChecker).
+# The running numbers of positive and negative ranks only depend on the downset, so the pair of flags is all the
+# sign test needs. The counts are Python integers, hence exact for any number of elements.
+def count_total_extensions(graph, positives=None, negatives=None, repetitions=None, number_elements=None):
+    if positives is None:
+        positives = {1, 5, 6, 7}
+    if negatives is None:
+        negatives = {4, 3, 2, 8}
+    if number_elements is None:
+        number_elements = max([8] + [max(edge) for edge in graph])
+    if repetitions is None:
+        repetitions = [1] * number_elements
+    length = len(positives)
+    fitter = [0] * (number_elements + 1)  # fitter[a] is the bit mask of elements that must be placed before a.
     for edge in graph:
-        if fitness.index(edge[0]) < fitness.index(edge[1]):
-            compatible = False
-            break
-    if compatible:
-        output.append(fitness)
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        compatible = True
-        for edge in graph:
-            if fitness.index(edge[0]) < fitness.index(edge[1]):
-                compatible = False
-                break
-        if compatible:
-            output.append(fitness)
+        fitter[edge[0]] |= 1 << (edge[1] - 1)
+    positive_weights = [0] * (number_elements + 1)
+    negative_weights = [0] * (number_elements + 1)
+    for genotype in positives:
+        positive_weights[genotype] = repetitions[genotype - 1]
+    for genotype in negatives:
+        negative_weights[genotype] = repetitions[genotype - 1]
+    layer = {(0, 0, 0, True, True): 1}  # (downset, positive count, negative count, positive, negative): number.
+    for _ in range(number_elements):
+        next_layer = {}
+        for state in layer:
+            downset, positive_count, negative_count, positive, negative = state
+            number = layer[state]
+            for a in range(1, number_elements + 1):
+                bit = 1 << (a - 1)
+                if downset & bit or fitter[a] & ~downset:
+                    continue
+                next_positive_count = positive_count + positive_weights[a]
+                next_negative_count = negative_count + negative_weights[a]
+                next_positive = positive and min(next_negative_count, length) <= next_positive_count
+                next_negative = negative and min(next_positive_count, length) <= next_negative_count
+                next_state = (downset | bit, next_positive_count, next_negative_count, next_positive, next_negative)
+                next_layer[next_state] = next_layer.get(next_state, 0) + number
+        layer = next_layer
+    number_extensions = 0
+    number_positive = 0
+    number_negative = 0
+    for state in layer:
+        number_extensions += layer[state]
+        if state[3]:
+            number_positive += layer[state]
+        elif state[4]:
+            number_negative += layer[state]
+    return [number_extensions, number_positive, number_negative]
+
+
+# Memoization of the analyses of partial orders by their canonical forms (see AnalysisCache).
+# Partial orders with the same transitive closure have the same total extensions, so a partial order is keyed by its
+# transitive reduction. Moreover, a symmetry of the cube that maps the positives and the negatives of a circuit to
+# themselves (keeping the repetitions) maps the total extensions of a partial order to those of its image with the same
+# interaction signs, so optionally the key is the smallest of the reductions of the images under such symmetries.
+
+
+# Returns the transitive reduction of partial_order (a list of edges [a, b] on {1, ..., number_elements}) as a sorted
+# list of edges, or None if partial_order contains a cycle. The transitive closure is computed on bit masks.
+def transitive_reduction(partial_order, number_elements=None):
+    if number_elements is None:
+        number_elements = max([8] + [max(edge) for edge in partial_order])
+    closure = [0] * (number_elements + 1)  # closure[a] is the bit mask of the elements above a.
+    for edge in partial_order:
+        closure[edge[0]] |= 1 << edge[1]
+    for k in range(1, number_elements + 1):
+        for a in range(1, number_elements + 1):
+            if closure[a] >> k & 1:
+                closure[a] |= closure[k]
+    output = []
+    for a in range(1, number_elements + 1):
+        if closure[a] >> a & 1:
+            return None
+        implied = 0
+        for b in range(1, number_elements + 1):
+            if closure[a] >> b & 1:
+                implied |= closure[b]
+        direct = closure[a] & ~implied
+        for b in range(1, number_elements + 1):
+            if direct >> b & 1:
+                output.append([a, b])
     return output
 
 
-def genotype_to_index(genotype):
-    if genotype == 0:
-        return 1
-    elif genotype == 1:
-        return 2
-    elif genotype == 10:
-        return 3
-    elif genotype == 100:
-        return 4
-    elif genotype == 11:
-        return 5
-    elif genotype == 101:
-        return 6
-    elif genotype == 110:
-        return 7
-    elif genotype == 111:
-        return 8
-    else:
+# Returns the symmetries of the cube (as in ranks_to_graph.cube_symmetries) that map positives to positives and
+# negatives to negatives, and keep repetitions.
+def circuit_symmetries(positives, negatives, repetitions, number_loci=3):
+    output = []
+    for image in cube_symmetries(number_loci):
+        if {image[a] for a in positives} == set(positives) and {image[a] for a in negatives} == set(negatives) and \
+                all([repetitions[image[a] - 1] == repetitions[a - 1] for a in range(1, len(image))]):
+            output.append(image)
+    return output
+
+
+# Returns the canonical form of partial_order: the tuple of the edges of its transitive reduction, or the smallest
+# such tuple over the images of the reduction under symmetries (e.g. circuit_symmetries) if given.
+# All partial orders with cycles have the canonical form ("cycle",).
+def canonical_partial_order(partial_order, symmetries=None, number_elements=None):
+    reduction = transitive_reduction(partial_order, number_elements)
+    if reduction is None:
+        return ("cycle",)
+    output = tuple([tuple(edge) for edge in reduction])
+    for image in symmetries or []:
+        output = min(output, tuple(sorted([(image[edge[0]], image[edge[1]]) for edge in reduction])))
+    return output
+
+
+# Bounded LRU memo of analysis results with string keys, e.g. repr of a circuit and a canonical form.
+# If store_file is given, the results are also kept in ./outputs/store_file (a shelve) and found there in later runs;
+# call close() at the end to write it to disk. If symmetric == True, the users of the cache key partial orders modulo
+# circuit_symmetries. hits and misses count the lookups.
+# Example of usage:
+# cache = AnalysisCache(store_file="partial_orders_cache", symmetric=True)
+# analyze_partial_orders("partial_orders.md", cache=cache)
+# cache.close()
+class AnalysisCache:
+    def __init__(self, maxsize=2 ** 16, store_file=None, symmetric=False):
+        self.maxsize = maxsize
+        self.symmetric = symmetric
+        self.entries = collections.OrderedDict()
+        self.store = None
+        if store_file is not None:
+            self.store = shelve.open("./outputs/%s" % store_file)
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the result stored under key or None.
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.store is not None and key in self.store:
+            self.hits += 1
+            value = self.store[key]
+            self.put(key, value, False)
+            return value
+        self.misses += 1
+        return None
+
+    # Stores value under key, evicting the least recently used entry if the cache is full.
+    def put(self, key, value, persistent=True):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        if persistent and self.store is not None:
+            self.store[key] = value
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+
+# Batch counting of total extensions on a pool of processes (see analyze_partial_orders).
+# The positions of genotypes in all rankings (permutation_table) and the sign masks of the circuit are computed once in
+# the parent process and put into shared memory, and the workers attach to it in the pool initializer, so that only the
+# partial orders are sent with the tasks. The results come back in the order of the partial orders.
+# For more than max_table_elements elements, the table of rankings is too large and count_total_extensions is used.
+_shared_tables = {}
+
+
+# Returns [memories, descriptors]: the SharedMemory blocks holding copies of arrays (a dictionary of NumPy arrays) and
+# the dictionary of [block name, shape, dtype] to attach to them by attach_shared_tables.
+def share_tables(arrays):
+    memories = []
+    descriptors = {}
+    for name in arrays:
+        array = numpy.ascontiguousarray(arrays[name])
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        numpy.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+        memories.append(memory)
+        descriptors[name] = [memory.name, array.shape, array.dtype.str]
+    return [memories, descriptors]
+
+
+# Pool initializer: makes the read-only views of the shared tables described by descriptors (see share_tables).
+def attach_shared_tables(descriptors):
+    _shared_tables.clear()
+    for name in descriptors:
+        memory_name, shape, dtype = descriptors[name]
+        memory = shared_memory.SharedMemory(name=memory_name)
+        table = numpy.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        table.setflags(write=False)
+        _shared_tables[name] = [memory, table]
+
+
+# Returns [number of total extensions, number positive, number negative] for partial_order (as in
+# count_total_extensions) by filtering the positions of all rankings and counting the sign masks over the survivors.
+def count_with_tables(partial_order, positions, positive, negative):
+    mask = numpy.ones(positions.shape[0], dtype=bool)
+    for edge in partial_order:  # The fitter genotype edge[1] comes first.
+        mask &= positions[:, edge[1] - 1] < positions[:, edge[0] - 1]
+    number_positive = numpy.count_nonzero(mask & positive)
+    number_negative = numpy.count_nonzero(mask & negative & ~positive)
+    return [int(numpy.count_nonzero(mask)), int(number_positive), int(number_negative)]
+
+
+# Pool task: arguments is [partial_order, positives, negatives, repetitions, number_elements].
+def count_task(arguments):
+    if _shared_tables:
+        return count_with_tables(arguments[0], _shared_tables["positions"][1], _shared_tables["positive"][1],
+                                 _shared_tables["negative"][1])
+    return count_total_extensions(*arguments)
+
+
+# Returns the list of [number of total extensions, number positive, number negative] of all partial_orders, in their
+# order, for the circuit given by positives, negatives, and repetitions (as in count_total_extensions), computed on
+# number_processes processes (all cores if None, no pool if 1).
+# If cache (an AnalysisCache) is given, every canonical form is counted once and looked up afterwards.
+def batch_count_total_extensions(partial_orders, positives, negatives, repetitions, number_elements=8,
+                                 number_processes=None, chunk_size=16, max_table_elements=10, cache=None):
+    if cache is not None:  # Only the partial orders with new canonical forms are counted.
+        circuit = [sorted(positives), sorted(negatives), list(repetitions), number_elements]
+        symmetries = None
+        if cache.symmetric:
+            symmetries = circuit_symmetries(positives, negatives, repetitions, number_of_loci(number_elements))
+        keys = [repr([circuit, canonical_partial_order(partial_order, symmetries, number_elements)])
+                for partial_order in partial_orders]
+        output = [cache.get(key) for key in keys]
+        new = {}  # The new keys with the numbers of their first partial orders.
+        for i in range(len(keys)):
+            if output[i] is None and keys[i] not in new:
+                new[keys[i]] = i
+        counts = batch_count_total_extensions([partial_orders[i] for i in new.values()], positives, negatives,
+                                              repetitions, number_elements, number_processes, chunk_size,
+                                              max_table_elements)
+        counted = dict(zip(new, counts))
+        for key in counted:
+            cache.put(key, counted[key])
+        return [output[i] if output[i] is not None else counted[keys[i]] for i in range(len(keys))]
+    tables = {}
+    if number_elements <= max_table_elements:
+        rankings = get_all_rankings(number_elements)
+        tables["positions"] = get_positions(rankings)
+        tables["positive"], tables["negative"] = epistasis_masks(rankings, positives, negatives, repetitions)
+    tasks = [[partial_order, positives, negatives, repetitions, number_elements] for partial_order in partial_orders]
+    if number_processes == 1:
+        if not tables:
+            return [count_total_extensions(*task) for task in tasks]
+        return [count_with_tables(task[0], tables["positions"], tables["positive"], tables["negative"])
+                for task in tasks]
+    memories, descriptors = share_tables(tables)
+    try:
+        with multiprocessing.Pool(number_processes, attach_shared_tables, (descriptors,)) as pool:
+            output = list(pool.imap(count_task, tasks, chunk_size))
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+    return output
+
+
+# Returns the index of genotype, e.g. 0 = 1, 1 = 2, 10 = 3, 100 = 4, 11 = 5, 101 = 6, 110 = 7, 111 = 8 for three loci.
+# For number_loci > 3, genotypes are numbered as in genotype_space.GenotypeSpace (by the number of mutations).
+def genotype_to_index(genotype, number_loci=3):
+    try:
+        return get_genotype_space(number_loci).genotype_to_index(genotype)
+    except ValueError:
         print("\ngenotype_to_index received a non-genotype as input")
         sys.exit()
 
 
+# Yields the partial orders of file ./outputs/file_name (one per line, as in partial_orders_from_file) one by one, so
+# that long files are never held in memory. Genotypes are looked up in one dictionary built from genotype_space.
+# Raises ValueError for lines with entries that are not genotypes or with an odd number of entries.
+def iterate_partial_orders(file_name, number_loci=3):
+    space = get_genotype_space(number_loci)
+    indices = {}
+    for index in range(1, space.size + 1):
+        indices[int(space.index_to_genotype(index))] = index
+    partial_orders_file = open("./outputs/%s" % file_name, "r")
+    for line_number, line in enumerate(partial_orders_file, 1):
+        if line == "\n":
+            continue
+        entries = line.replace("[", "").replace("]", "").replace(" ", "").split(",")
+        try:
+            partial_order = [indices[int(s)] for s in entries]
+        except (KeyError, ValueError):
+            partial_orders_file.close()
+            raise ValueError("Line %s of %s contains entries that are not genotypes on %s loci: %s"
+                             % (line_number, file_name, number_loci, line.strip()))
+        if len(partial_order) % 2 != 0:
+            partial_orders_file.close()
+            raise ValueError("Line %s of %s contains an odd number of genotypes." % (line_number, file_name))
+        yield [partial_order[i:i + 2] for i in range(0, len(partial_order), 2)]
+    partial_orders_file.close()
+
+
+# Yields the lists of (up to) batch_size consecutive items of iterable.
+def iterate_batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 # Returns a list of partial orders on the set {1, ..., 8} given a file with partial orders on the set {000, ..., 111}.
 # The convention is: 000 = 1, 001 = 2, 010 = 3, 100 = 4, 011 = 5, 101 = 6, 110 = 7, 111 = 8
 # (To be compatible with other functions.)
-def partial_orders_from_file(file_name):
+# For number_loci > 3, genotypes are numbered as in genotype_space.GenotypeSpace (by the number of mutations).
+# Raises ValueError on entries that are not genotypes (see iterate_partial_orders).
+def partial_orders_from_file(file_name, number_loci=3):
     if not os.path.isfile("./outputs/%s" % file_name):
         print("\nPlease put the file with partial orders into directory 'outputs' inside the working directory.\n"
               "Then, check that the script is called with the correctly spelled file name, including the extension.")
         sys.exit()
-    partial_orders_file = open("./outputs/%s" % file_name, "r")
-    output = []
-    for line in partial_orders_file:
-        if line != "\n":
-            line = line.replace("[", "")
-            line = line.replace("]", "")
-            line = line.replace(" ", "")
-            partial_order = [int(s) for s in line.split(",")]
-            for i in range(len(partial_order)):
-                partial_order[i] = genotype_to_index(partial_order[i])
-            partial_order_formatted = []
-            for i in range(0, len(partial_order), 2):
-                partial_order_formatted.append([partial_order[i], partial_order[i + 1]])
-            output.append(partial_order_formatted)
-    partial_orders_file.close()
-    return output
+    return list(iterate_partial_orders(file_name, number_loci))
 
 
 # Returns a string over {000, ..., 111} that corresponds to total_order (list) over {1, ..., 8} using
 # 000 = 1, 001 = 2, 010 = 3, 100 = 4, 011 = 5, 101 = 6, 110 = 7, 111 = 8
-def convert_to_genotype(total_order):
-    output = []
-    for rank in total_order:
-        if rank == 1:
-            output.append("000")
-        elif rank == 2:
-            output.append("001")
-        elif rank == 3:
-            output.append("010")
-        elif rank == 4:
-            output.append("100")
-        elif rank == 5:
-            output.append("011")
-        elif rank == 6:
-            output.append("101")
-        elif rank == 7:
-            output.append("110")
-        elif rank == 8:
-            output.append("111")
+# For number_loci > 3, genotypes are numbered as in genotype_space.GenotypeSpace (by the number of mutations).
+def convert_to_genotype(total_order, number_loci=3):
+    space = get_genotype_space(number_loci)
+    output = [space.index_to_genotype(rank) for rank in total_order if 1 <= rank <= space.size]
     output = str(output)
     output = output.replace("'", "")
     return output
 
 
+# Returns the summary of the analysis of one partial order, as written into partial_orders_analysis.md.
+def partial_order_summary(number_extensions, number_positive, number_negative, interaction="three-way"):
+    imply_epistasis_total = number_positive + number_negative
+    imply_epistasis_total_percent = 100 * imply_epistasis_total / float(number_extensions)
+    imply_positive_percent = 100 * number_positive / float(number_extensions)
+    imply_negative_percent = 100 * number_negative / float(number_extensions)
+    return ("Number of total extensions: " + str(number_extensions) + "\n" +
+            "Imply %s interaction: " % interaction + str(imply_epistasis_total) +
+            " (%s%%)\n" % round(imply_epistasis_total_percent, 2) +
+            "Imply positive %s interaction: " % interaction + str(number_positive) +
+            " (%s%%)\n" % round(imply_positive_percent, 2) +
+            "Imply negative %s interaction: " % interaction + str(number_negative) +
+            " (%s%%)\n" % round(imply_negative_percent, 2))
+
+
 # Takes file ./outputs/partial_orders.md with partial orders.
 # If 'details' == True, returns two files: ./outputs/partial_orders_analysis.md and
 # ./outputs/partial_orders_analysis_details.md.
@@ -113,8 +443,16 @@ def convert_to_genotype(total_order):
 # total orders that imply three-way epistasis.
 # The second contains the lists of those orders. Takes more time to produce than only the numbers.
 # If 'details' == False, only the first file is returned. More efficient.
-def analyze_partial_orders(file_name, details=False):
-    partial_orders = partial_orders_from_file(file_name)
+# For number_loci > 3, the analysis is of the total number_loci-way interaction (see genotype_space).
+# If 'details' == False, the partial orders are counted on number_processes processes (all cores if None), see
+# batch_count_total_extensions, and repeated partial orders are counted once if cache (an AnalysisCache) is given.
+def analyze_partial_orders(file_name, details=False, number_loci=3, number_processes=1, cache=None):
+    partial_orders = partial_orders_from_file(file_name, number_loci)
+    space = get_genotype_space(number_loci)
+    positives, negatives = space.total_interaction()
+    repetitions = [1] * space.size
+    interaction = "three-way" if number_loci == 3 else "%s-way" % number_loci
+    checker = EpistasisChecker(positives, negatives, repetitions)
     if os.path.isfile("./outputs/partial_orders_analysis.md"):
         print("\nFile partial_orders_analysis.md already exists in directory 'outputs'. Please remove and rerun.")
         sys.exit()
@@ -139,51 +477,39 @@ def analyze_partial_orders(file_name, details=False):
                                   "and to stay tuned.\n"
                                   "If you publish the results obtained with the help of this software, "
                                   "please don't forget to cite us.\n")
-    for partial_order in partial_orders:
-        partial_order_number = partial_orders.index(partial_order) + 1
+    if not details:
+        counts = batch_count_total_extensions(partial_orders, positives, negatives, repetitions, space.size,
+                                              number_processes, cache=cache)
+    for partial_order_number, partial_order in enumerate(partial_orders, 1):
         output_file.write("\n\n## Analysis of partial order number " + str(partial_order_number) + "\n\n")
         if details:
             output_file_details.write("\n\n## Analysis of partial order number " + str(partial_order_number) + "\n\n")
-        total_extensions = all_total_extensions_brute_force(partial_order)
-        imply_positive = []
-        imply_negative = []
-        for total_extension in total_extensions:
-            if epistasis_positive(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                  repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                imply_positive.append(total_extension)
-            elif epistasis_negative(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                    repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                imply_negative.append(total_extension)
-        imply_epistasis_total = len(imply_positive) + len(imply_negative)
-        imply_epistasis_total_percent = 100 * imply_epistasis_total / float(len(total_extensions))
-        imply_positive_percent = 100 * len(imply_positive) / float(len(total_extensions))
-        imply_negative_percent = 100 * len(imply_negative) / float(len(total_extensions))
-        output_file.write("Number of total extensions: " + str(len(total_extensions)) + "\n" +
-                          "Imply three-way interaction: " + str(imply_epistasis_total) +
-                          " (%s%%)\n" % round(imply_epistasis_total_percent, 2) +
-                          "Imply positive three-way interaction: " + str(len(imply_positive)) +
-                          " (%s%%)\n" % round(imply_positive_percent, 2) +
-                          "Imply negative three-way interaction: " + str(len(imply_negative)) +
-                          " (%s%%)\n" % round(imply_negative_percent, 2))
+            total_extensions = all_total_extensions(partial_order, space.size)
+            number_extensions = len(total_extensions)
+            number_positive = 0
+            number_negative = 0
+            for total_extension in total_extensions:
+                epi_pos, epi_neg = checker.check(total_extension)
+                if epi_pos:
+                    number_positive += 1
+                elif epi_neg:
+                    number_negative += 1
+        else:  # Counted without enumerating the total extensions.
+            number_extensions, number_positive, number_negative = counts[partial_order_number - 1]
+        summary = partial_order_summary(number_extensions, number_positive, number_negative, interaction)
+        output_file.write(summary)
         if details:
-            output_file_details.write("Number of total extensions: " + str(len(total_extensions)) + "\n" +
-                                      "Imply three-way interaction: " + str(imply_epistasis_total) +
-                                      " (%s%%)\n" % round(imply_epistasis_total_percent, 2) +
-                                      "Imply positive three-way interaction: " + str(len(imply_positive)) +
-                                      " (%s%%)\n" % round(imply_positive_percent, 2) +
-                                      "Imply negative three-way interaction: " + str(len(imply_negative)) +
-                                      " (%s%%)\n" % round(imply_negative_percent, 2) + "\n" +
-                                      "List of total extensions followed by three-way interaction signs:\n\n")
+            lines = [summary, "\n", "List of total extensions followed by %s interaction signs:\n\n" % interaction]
             for total_extension in total_extensions:
-                output_file_details.write(convert_to_genotype(total_extension))
-                if epistasis_positive(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                      repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                    output_file_details.write("  +\n")
-                elif epistasis_negative(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                        repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                    output_file_details.write("  -\n")
+                lines.append(convert_to_genotype(total_extension, number_loci))
+                epi_pos, epi_neg = checker.check(total_extension)
+                if epi_pos:
+                    lines.append("  +\n")
+                elif epi_neg:
+                    lines.append("  -\n")
                 else:
-                    output_file_details.write(" +/-\n")
+                    lines.append(" +/-\n")
+            output_file_details.write("".join(lines))
     output_file.write("\n")
     output_file.close()
     if details:
@@ -404,8 +730,8 @@ def get_circuit_meaning(circuit):
 #
 # The reason to keep both analyze_partial_orders and analyze_partial_orders_for_circuit is that the former should be
 # more efficient, but that has to be tested.
-def analyze_partial_orders_for_circuit(file_name, details=False,
-                                       positives=None, negatives=None, repetitions=None, genotype_format=True):
+def analyze_partial_orders_for_circuit(file_name, details=False, positives=None, negatives=None, repetitions=None,
+                                       genotype_format=True, number_processes=1, cache=None):
     if repetitions is None:
         repetitions = [1, 1, 1, 1, 1, 1, 1, 1]
     else:
@@ -419,6 +745,8 @@ def analyze_partial_orders_for_circuit(file_name, details=False,
     elif genotype_format:
         negatives = {genotype_to_index(i) for i in negatives}
     partial_orders = partial_orders_from_file(file_name)
+    checker = EpistasisChecker(positives, negatives, repetitions)
+    three_way_checker = EpistasisChecker({1, 5, 6, 7}, {4, 3, 2, 8}, [1, 1, 1, 1, 1, 1, 1, 1])
     if os.path.isfile("./outputs/partial_orders_analysis.md"):
         print("\nFile partial_orders_analysis.md already exists in directory 'outputs'. Please remove and rerun.")
         sys.exit()
@@ -446,49 +774,39 @@ def analyze_partial_orders_for_circuit(file_name, details=False,
                                   "If you publish the results obtained with the help of this software, "
                                   "please don't forget to cite us.\n")
         output_file_details.write("\n\n# Analysis of circuit interaction\ncircuit = " + circuit + "\n")
-    for partial_order in partial_orders:
-        partial_order_number = partial_orders.index(partial_order) + 1
+    if not details:
+        counts = batch_count_total_extensions(partial_orders, positives, negatives, repetitions,
+                                              number_processes=number_processes, cache=cache)
+    for partial_order_number, partial_order in enumerate(partial_orders, 1):
         output_file.write("\n\n## Analysis of partial order number " + str(partial_order_number) + "\n\n")
         if details:
             output_file_details.write("\n\n## Analysis of partial order number " + str(partial_order_number) + "\n\n")
-        total_extensions = all_total_extensions_brute_force(partial_order)
-        imply_positive = []
-        imply_negative = []
-        for total_extension in total_extensions:
-            if epistasis_positive(total_extension, positives, negatives, repetitions):
-                imply_positive.append(total_extension)
-            elif epistasis_negative(total_extension, positives, negatives, repetitions):
-                imply_negative.append(total_extension)
-        imply_epistasis_total = len(imply_positive) + len(imply_negative)
-        imply_epistasis_total_percent = 100 * imply_epistasis_total / float(len(total_extensions))
-        imply_positive_percent = 100 * len(imply_positive) / float(len(total_extensions))
-        imply_negative_percent = 100 * len(imply_negative) / float(len(total_extensions))
-        output_file.write("Number of total extensions: " + str(len(total_extensions)) + "\n" +
-                          "Imply circuit interaction: " + str(imply_epistasis_total) +
-                          " (%s%%)\n" % round(imply_epistasis_total_percent, 2) +
-                          "Imply positive circuit interaction: " + str(len(imply_positive)) +
-                          " (%s%%)\n" % round(imply_positive_percent, 2) +
-                          "Imply negative circuit interaction: " + str(len(imply_negative)) +
-                          " (%s%%)\n" % round(imply_negative_percent, 2))
+            total_extensions = all_total_extensions(partial_order)
+            number_extensions = len(total_extensions)
+            number_positive = 0
+            number_negative = 0
+            for total_extension in total_extensions:
+                epi_pos, epi_neg = checker.check(total_extension)
+                if epi_pos:
+                    number_positive += 1
+                elif epi_neg:
+                    number_negative += 1
+        else:  # Counted without enumerating the total extensions.
+            number_extensions, number_positive, number_negative = counts[partial_order_number - 1]
+        summary = partial_order_summary(number_extensions, number_positive, number_negative, "circuit")
+        output_file.write(summary)
         if details:
-            output_file_details.write("Number of total extensions: " + str(len(total_extensions)) + "\n" +
-                                      "Imply circuit interaction: " + str(imply_epistasis_total) +
-                                      " (%s%%)\n" % round(imply_epistasis_total_percent, 2) +
-                                      "Imply positive circuit interaction: " + str(len(imply_positive)) +
-                                      " (%s%%)\n" % round(imply_positive_percent, 2) +
-                                      "Imply negative circuit interaction: " + str(len(imply_negative)) +
-                                      " (%s%%)\n" % round(imply_negative_percent, 2) + "\n" +
-                                      "List of total extensions followed by circuit interaction signs:\n\n")
+            lines = [summary, "\n", "List of total extensions followed by circuit interaction signs:\n\n"]
             for total_extension in total_extensions:
-                output_file_details.write(convert_to_genotype(total_extension))
-                if epistasis_positive(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                      repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                    output_file_details.write("  +\n")
-                elif epistasis_negative(total_extension, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8},
-                                        repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
-                    output_file_details.write("  -\n")
+                lines.append(convert_to_genotype(total_extension))
+                epi_pos, epi_neg = three_way_checker.check(total_extension)
+                if epi_pos:
+                    lines.append("  +\n")
+                elif epi_neg:
+                    lines.append("  -\n")
                 else:
-                    output_file_details.write(" +/-\n")
+                    lines.append(" +/-\n")
+            output_file_details.write("".join(lines))
     output_file.write("\n")
     output_file.close()
     if details:
@@ -497,6 +815,114 @@ def analyze_partial_orders_for_circuit(file_name, details=False,
     return
 
 
+# Streaming analysis of long files of partial orders: the partial orders are parsed lazily, counted in batches of
+# batch_size (see batch_count_total_extensions), and the results are written into ./outputs/results_file as they come,
+# without the markdown. If results_file ends with .npz, the results are saved in columns (NumPy .npz format), otherwise
+# as JSON lines, one per partial order:
+# {"number": 1, "partial_order": [[8, 6], [7, 8], [6, 5], [1, 4]], "extensions": 840, "positive": 64, "negative": 178}
+# The partial orders are in index format, and the circuit is given by positives, negatives, and repetitions in index
+# format (by default, the total interaction on number_loci loci).
+# The report is rendered by render_partial_orders_report.
+# Example of usage:
+# analyze_partial_orders_to_results("partial_orders.md", "partial_orders_analysis.jsonl")
+# render_partial_orders_report("partial_orders_analysis.jsonl")
+def analyze_partial_orders_to_results(file_name, results_file="partial_orders_analysis.jsonl", number_loci=3,
+                                      positives=None, negatives=None, repetitions=None, batch_size=10000,
+                                      number_processes=1, cache=None):
+    space = get_genotype_space(number_loci)
+    if positives is None or negatives is None:
+        positives, negatives = space.total_interaction()
+    if repetitions is None:
+        repetitions = [1] * space.size
+    if not os.path.isfile("./outputs/%s" % file_name):
+        print("\nPlease put the file with partial orders into directory 'outputs' inside the working directory.\n"
+              "Then, check that the script is called with the correctly spelled file name, including the extension.")
+        sys.exit()
+    if os.path.isfile("./outputs/%s" % results_file):
+        print("\nFile %s already exists in directory 'outputs'. Please remove and rerun." % results_file)
+        sys.exit()
+    columnar = results_file.endswith(".npz")
+    if columnar:
+        columns = {"counts": [], "edges": [], "sizes": []}
+    else:
+        output_file = open("./outputs/%s" % results_file, "w", buffering=2 ** 20)
+    number = 0
+    for partial_orders in iterate_batches(iterate_partial_orders(file_name, number_loci), batch_size):
+        counts = batch_count_total_extensions(partial_orders, positives, negatives, repetitions, space.size,
+                                              number_processes, cache=cache)
+        if columnar:
+            columns["counts"].append(numpy.array(counts, dtype=numpy.int64).reshape(-1, 3))
+            columns["edges"].extend(partial_orders)
+            columns["sizes"].append(numpy.array([len(partial_order) for partial_order in partial_orders]))
+        else:
+            lines = []
+            for i in range(len(partial_orders)):
+                lines.append(json.dumps({"number": number + i + 1, "partial_order": partial_orders[i],
+                                         "extensions": counts[i][0], "positive": counts[i][1],
+                                         "negative": counts[i][2]}) + "\n")
+            output_file.write("".join(lines))
+        number += len(partial_orders)
+    if not columnar:
+        output_file.close()
+        return
+    counts = numpy.concatenate(columns["counts"]) if number > 0 else numpy.zeros((0, 3), dtype=numpy.int64)
+    sizes = numpy.concatenate(columns["sizes"]) if number > 0 else numpy.zeros(0, dtype=numpy.int64)
+    edges = numpy.array([edge for partial_order in columns["edges"] for edge in partial_order],
+                        dtype=numpy.uint16).reshape(-1, 2)
+    numpy.savez_compressed("./outputs/%s" % results_file, number=numpy.arange(1, number + 1),
+                           extensions=counts[:, 0], positive=counts[:, 1], negative=counts[:, 2], edges=edges,
+                           offsets=numpy.concatenate([[0], numpy.cumsum(sizes)]).astype(numpy.int64))
+
+
+# Yields the results of analyze_partial_orders_to_results saved in ./outputs/results_file (JSON lines or .npz) as
+# dictionaries with keys "number", "partial_order", "extensions", "positive", and "negative".
+def iterate_partial_order_results(results_file):
+    if results_file.endswith(".npz"):
+        results = numpy.load("./outputs/%s" % results_file)
+        edges = results["edges"].tolist()
+        offsets = results["offsets"]
+        columns = [results[key].tolist() for key in ["number", "extensions", "positive", "negative"]]
+        for i in range(len(columns[0])):
+            yield {"number": columns[0][i], "partial_order": edges[offsets[i]:offsets[i + 1]],
+                   "extensions": columns[1][i], "positive": columns[2][i], "negative": columns[3][i]}
+        return
+    results_file = open("./outputs/%s" % results_file, "r")
+    for line in results_file:
+        if line.strip():
+            yield json.loads(line)
+    results_file.close()
+
+
+# Writes the report ./outputs/report_file (as written by analyze_partial_orders) from the results saved in
+# ./outputs/results_file by analyze_partial_orders_to_results. If circuit is given (see get_circuit_formula), the
+# report is that of analyze_partial_orders_for_circuit.
+def render_partial_orders_report(results_file, report_file="partial_orders_analysis.md", interaction="three-way",
+                                 circuit=None, batch_size=10000):
+    if os.path.isfile("./outputs/%s" % report_file):
+        print("\nFile %s already exists in directory 'outputs'. Please remove and rerun." % report_file)
+        sys.exit()
+    output_file = open("./outputs/%s" % report_file, "w", buffering=2 ** 20)
+    output_file.write("This file has been created using software package Fitlands "
+                      "(Alex Gavryushkin, CBG, D-BSSE, ETH Zurich).\n"
+                      "Please refer to [https://github.com/gavruskin/fitlands] for legal matters, "
+                      "to obtain up-to-date bibliographic information for Fitlands, "
+                      "and to stay tuned.\n"
+                      "If you publish the results obtained with the help of this software, "
+                      "please don't forget to cite us.\n")
+    if circuit is not None:
+        interaction = "circuit"
+        output_file.write("\n\n# Analysis of circuit interaction\ncircuit = " + circuit + "\n")
+    for results in iterate_batches(iterate_partial_order_results(results_file), batch_size):
+        lines = []
+        for result in results:
+            lines.append("\n\n## Analysis of partial order number " + str(result["number"]) + "\n\n")
+            lines.append(partial_order_summary(result["extensions"], result["positive"], result["negative"],
+                                               interaction))
+        output_file.write("".join(lines))
+    output_file.write("\n")
+    output_file.close()
+
+
 # Takes total_order as an input in the genotype format, e.g. {0, 11, 101} if genotype_format == True, or
 # in index format, e.g. {1, 5, 6}, otherwise.
 # Returns a file with the analysis of interactions implied by the rank order total_order for all 20 circuits.
@@ -526,9 +952,10 @@ def analyze_total_order_for_all_circuits(total_order, genotype_format=True):
         repetitions = get_repetitions_from_circuit_number(circuit_number + 1)
         circuit = get_circuit_formula(positives, negatives, repetitions)
         circuits.append(circuit)
-        if epistasis_positive(total_order, positives, negatives, repetitions):
+        epi_pos, epi_neg = EpistasisChecker(positives, negatives, repetitions).check(total_order)
+        if epi_pos:
             imply_positive.append(circuit)
-        elif epistasis_negative(total_order, positives, negatives, repetitions):
+        elif epi_neg:
             imply_negative.append(circuit)
     interaction_total = len(imply_positive) + len(imply_negative)
     interaction_percent = 100 * interaction_total / float(20)
@@ -544,9 +971,10 @@ def analyze_total_order_for_all_circuits(total_order, genotype_format=True):
         repetitions = get_repetitions_from_circuit_number(circuit_number + 1)
         circuit = get_circuit_formula(positives, negatives, repetitions)
         circuits_interaction_coordinates.append(circuit)
-        if epistasis_positive(total_order, positives, negatives, repetitions):
+        epi_pos, epi_neg = EpistasisChecker(positives, negatives, repetitions).check(total_order)
+        if epi_pos:
             imply_positive_interaction_coordinates.append(circuit)
-        elif epistasis_negative(total_order, positives, negatives, repetitions):
+        elif epi_neg:
             imply_negative_interaction_coordinates.append(circuit)
 
     # Write the results into the file.
@@ -0,0 +1,124 @@
+import math
+import numpy as np
+
+__author__ = "@gavruskin"
+
+
+# The space of all rankings of n genotypes {1, ..., n} as one NumPy array.
+# Row r of get_all_rankings(n) is the ranking number r in the order of get_next_ordering / ordering_to_fitness
+# (three_way_epistasis), so that files produced from the table are identical to those produced by the loops.
+# The number r is called the rank of the ranking; rankings_to_ranks is the inverse of get_all_rankings.
+
+_all_rankings = {}
+
+
+# Returns the (n!, n) array of all rankings of {1, ..., n}, row r being the ranking with rank r.
+# The array is computed once per n and is read-only.
+def get_all_rankings(n=8):
+    if n not in _all_rankings:
+        number = math.factorial(n)
+        dtype = np.uint8 if n < 256 else np.uint16
+        ranks = np.arange(number, dtype=np.int64)
+        remaining = np.tile(np.arange(1, n + 1, dtype=dtype), (number, 1))
+        rankings = np.empty((number, n), dtype=dtype)
+        base = 1
+        for i in range(n):  # The i-th entry of the ordering is (rank // base) % (n - i) + 1, see get_next_ordering.
+            digits = (ranks // base) % (n - i)
+            rankings[:, i] = remaining[np.arange(number), digits]
+            keep = np.ones(remaining.shape, dtype=bool)
+            keep[np.arange(number), digits] = False
+            remaining = remaining[keep].reshape(number, n - i - 1)
+            base *= n - i
+        rankings.setflags(write=False)
+        _all_rankings[n] = rankings
+    return _all_rankings[n]
+
+
+# Returns the ranks of the rankings in the array (or list of lists) rankings, that is, their row numbers in
+# get_all_rankings(n).
+def rankings_to_ranks(rankings):
+    rankings = np.atleast_2d(np.asarray(rankings))
+    n = rankings.shape[1]
+    ranks = np.zeros(rankings.shape[0], dtype=np.int64)
+    base = 1
+    for i in range(n - 1):  # The digit is the number of entries to the right of i that are smaller than entry i.
+        digits = np.sum(rankings[:, i + 1:] < rankings[:, i:i + 1], axis=1)
+        ranks += digits * base
+        base *= n - i
+    return ranks
+
+
+# Returns the rank of a single ranking w.
+def ranking_to_rank(w):
+    return int(rankings_to_ranks([w])[0])
+
+
+# Returns the array of positions: positions[r, g - 1] is the position of genotype g in rankings[r].
+def get_positions(rankings):
+    rankings = np.atleast_2d(np.asarray(rankings))
+    number, n = rankings.shape
+    positions = np.empty((number, n), dtype=np.int16)
+    positions[np.arange(number)[:, None], rankings.astype(np.intp) - 1] = np.arange(n, dtype=np.int16)
+    return positions
+
+
+# Returns the pair of boolean masks [positive, negative] over the rows of rankings, for the circuit given by
+# positives, negatives, and repetitions (as in epistasis_positive and epistasis_negative).
+# Batched version of EpistasisChecker: the running numbers of positive and negative ranks are cumulative sums along
+# the rankings, and the ranking implies positive interaction iff min(negative count, len(positives)) <= positive count
+# at every position (and symmetrically for negative interaction).
+def epistasis_masks(rankings, positives, negatives, repetitions):
+    rankings = np.atleast_2d(np.asarray(rankings))
+    n = rankings.shape[1]
+    length = len(positives)
+    positive_weights = np.zeros(n + 1, dtype=np.int16)
+    negative_weights = np.zeros(n + 1, dtype=np.int16)
+    for genotype in positives:
+        positive_weights[genotype] = repetitions[genotype - 1]
+    for genotype in negatives:
+        negative_weights[genotype] = repetitions[genotype - 1]
+    positive_counts = np.cumsum(positive_weights[rankings], axis=1, dtype=np.int16)
+    negative_counts = np.cumsum(negative_weights[rankings], axis=1, dtype=np.int16)
+    positive = np.all(np.minimum(negative_counts, length) <= positive_counts, axis=1)
+    negative = np.all(np.minimum(positive_counts, length) <= negative_counts, axis=1)
+    return [positive, negative]
+
+
+# Returns the boolean mask over the rows of rankings of those rankings in which, for every edge [a, b] of graph,
+# a comes before b.
+def consistent_mask(rankings, graph):
+    rankings = np.atleast_2d(np.asarray(rankings))
+    mask = np.ones(rankings.shape[0], dtype=bool)
+    if len(graph) == 0:
+        return mask
+    positions = get_positions(rankings)
+    edges = np.asarray(graph, dtype=np.intp) - 1
+    for a, b in edges:
+        mask &= positions[:, a] < positions[:, b]
+    return mask
+
+
+# Yields the positions k (from 0) of the adjacent transpositions of the Steinhaus-Johnson-Trotter walk ("plain
+# changes", Knuth's Algorithm P) through all n! rankings of {1, ..., n}: starting from [1, ..., n] and swapping
+# entries k and k + 1 for every yielded k visits every ranking exactly once. Each step takes O(1) amortized time.
+def adjacent_transpositions(n):
+    c = [0] * (n + 1)
+    o = [1] * (n + 1)
+    while True:
+        j = n
+        s = 0
+        while True:
+            q = c[j] + o[j]
+            if q < 0:
+                o[j] = -o[j]
+                j -= 1
+            elif q == j:
+                if j == 1:
+                    return
+                s += 1
+                o[j] = -o[j]
+                j -= 1
+            else:
+                yield min(j - c[j] + s, j - q + s) - 1
+                c[j] = q
+                break
@@ -1,4 +1,6 @@
 import numpy
+from permutation_table import get_all_rankings, rankings_to_ranks, epistasis_masks
+from circuit_epistasis import get_positives_list, get_negatives_list, get_repetitions_from_circuit_number
 
 
 __author__ = '@gavruskin'
@@ -58,5 +60,94 @@ def dist_to_negative_epi(w, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8}):
     return output
 
 
-print(dist_to_positive_epi([8, 3, 7, 6, 5, 2, 4, 1]))
-print(dist_to_negative_epi([8, 3, 7, 6, 5, 2, 4, 1]))
+# The exact distances to interaction in the Cayley graph of rankings: rankings are neighbors if they differ by a swap of
+# two adjacent entries (as in give_rank_neighbors), so that the distance between two rankings is their Kendall tau
+# distance. For every ranking, the distance to the nearest ranking that implies positive (negative) interaction for a
+# circuit is found for all n! rankings at once, by breadth-first search starting from all rankings that imply it.
+# The distances are kept in uint8 arrays indexed by the ranks of rankings (see permutation_table), 255 meaning that
+# no ranking implies the interaction.
+
+_neighbor_tables = {}
+_distance_tables = {}
+
+
+# Returns the (n!, n - 1) array of neighbors: entry [r, i] is the rank of the ranking with rank r with entries i and
+# i + 1 swapped. The array is computed once per n.
+def get_neighbor_table(n=8):
+    if n not in _neighbor_tables:
+        rankings = get_all_rankings(n)
+        table = numpy.empty((len(rankings), n - 1), dtype=numpy.int32)
+        for i in range(n - 1):
+            swapped = rankings.copy()
+            swapped[:, [i, i + 1]] = swapped[:, [i + 1, i]]
+            table[:, i] = rankings_to_ranks(swapped)
+        table.setflags(write=False)
+        _neighbor_tables[n] = table
+    return _neighbor_tables[n]
+
+
+# Returns the uint8 array of the distances from all rankings (by rank) to the nearest ranking in mask, a boolean array
+# over the ranks, by multi-source breadth-first search over the neighbor table.
+def distances_to_mask(mask, n=8):
+    neighbors = get_neighbor_table(n)
+    distances = numpy.full(len(neighbors), 255, dtype=numpy.uint8)
+    frontier = numpy.flatnonzero(mask)
+    distances[frontier] = 0
+    distance = 0
+    while len(frontier) > 0 and distance < 254:
+        distance += 1
+        candidates = numpy.unique(neighbors[frontier].ravel())
+        frontier = candidates[distances[candidates] == 255]
+        distances[frontier] = distance
+    return distances
+
+
+# Returns [positive distances, negative distances], the uint8 arrays of the distances from all rankings of
+# {1, ..., n} (by rank) to the nearest ranking that implies positive and negative interaction for the circuit given by
+# positives, negatives, and repetitions (as in EpistasisChecker). The arrays are computed once per circuit.
+def get_distance_tables(positives=None, negatives=None, repetitions=None, n=8):
+    if positives is None:
+        positives = {1, 5, 6, 7}
+    if negatives is None:
+        negatives = {4, 3, 2, 8}
+    if repetitions is None:
+        repetitions = [1] * n
+    key = repr([sorted(positives), sorted(negatives), list(repetitions), n])
+    if key not in _distance_tables:
+        epi_pos, epi_neg = epistasis_masks(get_all_rankings(n), positives, negatives, repetitions)
+        tables = [distances_to_mask(epi_pos, n), distances_to_mask(epi_neg, n)]
+        for table in tables:
+            table.setflags(write=False)
+        _distance_tables[key] = tables
+    return _distance_tables[key]
+
+
+# Returns the (24, 2, 8!) uint8 array of distances for all circuits and interaction coordinates (in the order of
+# circuit_epistasis.get_positives_list), entry [c, 0, r] (entry [c, 1, r]) being the distance from the ranking with
+# rank r to positive (negative) interaction for circuit number c + 1.
+def get_circuit_distance_table():
+    positives_list = get_positives_list()
+    negatives_list = get_negatives_list()
+    return numpy.array([get_distance_tables(positives_list[c], negatives_list[c],
+                                            get_repetitions_from_circuit_number(c + 1))
+                        for c in range(len(positives_list))])
+
+
+# Batched exact versions of dist_to_positive_epi and dist_to_negative_epi: return the arrays of the numbers of swaps
+# of adjacent entries needed to make every row of rankings (an array or a list of lists) imply positive (negative)
+# interaction for the circuit given by positives, negatives, and repetitions. Unlike the above, these are metrics.
+def kendall_dist_to_positive_epi(rankings, positives=None, negatives=None, repetitions=None):
+    rankings = numpy.atleast_2d(numpy.asarray(rankings))
+    return get_distance_tables(positives, negatives, repetitions, rankings.shape[1])[0][rankings_to_ranks(rankings)]
+
+
+def kendall_dist_to_negative_epi(rankings, positives=None, negatives=None, repetitions=None):
+    rankings = numpy.atleast_2d(numpy.asarray(rankings))
+    return get_distance_tables(positives, negatives, repetitions, rankings.shape[1])[1][rankings_to_ranks(rankings)]
+
+
+if __name__ == "__main__":
+    print(dist_to_positive_epi([8, 3, 7, 6, 5, 2, 4, 1]))
+    print(dist_to_negative_epi([8, 3, 7, 6, 5, 2, 4, 1]))
+    print(kendall_dist_to_positive_epi([8, 3, 7, 6, 5, 2, 4, 1]))
+    print(kendall_dist_to_negative_epi([8, 3, 7, 6, 5, 2, 4, 1]))
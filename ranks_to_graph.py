@@ -1,33 +1,151 @@
 import os.path
+import itertools
+import numpy as np
+from genotype_space import get_genotype_space, number_of_loci
+from permutation_table import get_all_rankings, get_positions
 
 
 __author__ = "@gavruskin"
 
 
 # w_000 = w_1, w_001 = w_2, w_010 = w_3, w_100 = w_4, w_011 = w_5, w_101 = w_6, w_110 = w_7, w_111 = w_8
-def are_neighbors(a, b):
-    if (a == 1 and (b == 2 or b == 3 or b == 4)) or (a == 2 and (b == 1 or b == 5 or b == 6)):
-        return True
-    if (a == 3 and (b == 1 or b == 5 or b == 7)) or (a == 4 and (b == 1 or b == 6 or b == 7)):
-        return True
-    if (a == 5 and (b == 2 or b == 3 or b == 8)) or (a == 6 and (b == 2 or b == 4 or b == 8)):
-        return True
-    if (a == 7 and (b == 3 or b == 4 or b == 8)) or (a == 8 and (b == 5 or b == 6 or b == 7)):
-        return True
-    return False
+# For number_loci > 3, genotypes are numbered as in genotype_space.GenotypeSpace (by the number of mutations).
+def are_neighbors(a, b, number_loci=3):
+    return get_genotype_space(number_loci).are_neighbors(a, b)
 
 
+# The number of loci is derived from the length of the ranking w.
 def ranks_to_graph(w):
     # not tested
+    space = get_genotype_space(number_of_loci(len(w)))
     output = []
     for i in range(len(w)):
         for j in range(i+1, len(w)):
-            if are_neighbors(w[i], w[j]):
+            if space.are_neighbors(w[i], w[j]):
                 output.append([w[i], w[j]])
     output.sort()
     return output
 
 
+# Fitness graphs as integer codes: the edges of the genotype cube (GenotypeSpace.edges) are numbered from 0, and bit e
+# of the code of a fitness graph is 1 if edge e = [a, b], a < b, is oriented from a to b (that is, a comes before b in
+# the ranking, as in ranks_to_graph) and 0 otherwise. For up to 64 edges (up to four loci) the codes are integers
+# (uint64), otherwise rows of bytes (numpy.packbits of the bits). Both can be deduplicated with numpy.unique.
+
+
+# Returns the array of codes of the fitness graphs of all rows of rankings (an array or a list of lists), at once.
+def fitness_graph_codes(rankings):
+    rankings = np.atleast_2d(np.asarray(rankings))
+    space = get_genotype_space(number_of_loci(rankings.shape[1]))
+    edges = np.array(space.edges()) - 1
+    positions = get_positions(rankings)
+    bits = positions[:, edges[:, 0]] < positions[:, edges[:, 1]]
+    return bits_to_codes(bits)
+
+
+# Returns the codes of the rows of the boolean array bits (one column per cube edge).
+def bits_to_codes(bits):
+    if bits.shape[1] > 64:
+        return np.packbits(bits, axis=1)
+    weights = np.left_shift(np.uint64(1), np.arange(bits.shape[1], dtype=np.uint64))
+    return np.bitwise_or.reduce(np.where(bits, weights, np.uint64(0)), axis=1)
+
+
+# Returns the boolean array of bits (one column per cube edge) of codes on number_loci loci.
+def codes_to_bits(codes, number_loci):
+    number_edges = number_loci * 2 ** (number_loci - 1)
+    codes = np.asarray(codes)
+    if codes.ndim == 2:
+        return np.unpackbits(codes, axis=1, count=number_edges).astype(bool)
+    shifts = np.arange(number_edges, dtype=np.uint64)
+    return (np.right_shift(codes.astype(np.uint64)[:, None], shifts) & np.uint64(1)).astype(bool)
+
+
+# Returns the fitness graph (as returned by ranks_to_graph) with code code on number_loci loci.
+def code_to_graph(code, number_loci=3):
+    bits = codes_to_bits(np.asarray([code]), number_loci)[0]
+    output = []
+    for e, edge in enumerate(get_genotype_space(number_loci).edges()):
+        output.append(edge if bits[e] else [edge[1], edge[0]])
+    output.sort()
+    return output
+
+
+# Returns the list of all symmetries of the cube on number_loci loci as maps of genotype indices, image[index] being
+# the image of the genotype index (image[0] is not used): a symmetry permutes the loci of a genotype and then XOR-s it
+# with a fixed genotype.
+def cube_symmetries(number_loci):
+    space = get_genotype_space(number_loci)
+    output = []
+    for loci in itertools.permutations(range(number_loci)):
+        for mask in range(2 ** number_loci):
+            image = [0]
+            for index in range(1, space.size + 1):
+                bits = int(space.bits[index - 1])
+                permuted = 0
+                for locus in range(number_loci):
+                    if bits & (1 << locus):
+                        permuted |= 1 << loci[locus]
+                image.append(int(space.indices[permuted ^ mask]))
+            output.append(image)
+    return output
+
+
+# Returns the list of pairs [edge permutation, edge flips] of all symmetries of the cube on number_loci loci (see
+# cube_symmetries). A symmetry maps edge e to edge permutation[e], reversing its orientation (with respect to a < b)
+# if flips[e].
+def cube_edge_symmetries(number_loci):
+    edges = get_genotype_space(number_loci).edges()
+    edge_numbers = dict([[tuple(edge), e] for e, edge in enumerate(edges)])
+    output = []
+    for image in cube_symmetries(number_loci):
+        permutation = np.empty(len(edges), dtype=np.intp)
+        flips = np.empty(len(edges), dtype=bool)
+        for e, edge in enumerate(edges):
+            a, b = image[edge[0]], image[edge[1]]
+            permutation[e] = edge_numbers[(min(a, b), max(a, b))]
+            flips[e] = a > b
+        output.append([permutation, flips])
+    return output
+
+
+# Returns the canonical codes of codes on number_loci loci: the smallest code of the images of the graph under the
+# symmetries of the cube, so that isomorphic fitness graphs get the same canonical code.
+def canonical_codes(codes, number_loci):
+    bits = codes_to_bits(codes, number_loci)
+    output = None
+    for permutation, flips in cube_edge_symmetries(number_loci):
+        images = np.empty_like(bits)
+        images[:, permutation] = bits ^ flips
+        image_codes = bits_to_codes(images)
+        if output is None:
+            output = image_codes
+        elif image_codes.ndim == 1:
+            output = np.minimum(output, image_codes)
+        else:  # Rows of bytes are compared lexicographically, at their first different byte.
+            different = image_codes != output
+            first = np.argmax(different, axis=1)
+            rows = np.arange(len(output))
+            smaller = different[rows, first] & (image_codes[rows, first] < output[rows, first])
+            output = np.where(smaller[:, None], image_codes, output)
+    return output
+
+
+# Returns [codes, counts]: the codes of the different fitness graphs of rankings (by default, all rankings of the 8
+# genotypes on three loci) in the order of their first appearance, and the numbers of rankings with each graph.
+# If canonical == True, graphs that are the same up to the symmetries of the cube are counted as one.
+def unique_fitness_graphs(rankings=None, canonical=False):
+    if rankings is None:
+        rankings = get_all_rankings(8)
+    rankings = np.atleast_2d(np.asarray(rankings))
+    codes = fitness_graph_codes(rankings)
+    if canonical:
+        codes = canonical_codes(codes, number_of_loci(rankings.shape[1]))
+    unique, first, counts = np.unique(codes, axis=0, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    return [unique[order], counts[order]]
+
+
 def graph_from_ranks_to_file():
     if not os.path.isfile("./outputs/ranks.txt"):
         print("Please create file 'ranks.txt' in directory 'outputs' inside the working directory.")
@@ -38,28 +156,44 @@ def graph_from_ranks_to_file():
         print("File fitness_graph.txt is not empty.")
         return
     ranks_file = open("./outputs/ranks.txt", "r")
+    rankings = []
     for line in ranks_file:
         line = line.replace("[", "")
         line = line.replace("]", "")
-        ranks = [int(s) for s in line.split(', ')]
-        new_graph = ranks_to_graph(ranks)
-        graph_file.write(str(new_graph) + "\n")
-    graph_file.close()
+        rankings.append([int(s) for s in line.split(', ')])
     ranks_file.close()
+    number_loci = number_of_loci(len(rankings[0]))
+    for code in fitness_graph_codes(rankings):
+        graph_file.write(str(code_to_graph(code, number_loci)) + "\n")
+    graph_file.close()
 
 
-def number_of_different_graphs():
+# Returns the code (see fitness_graph_codes) of graph, a list of edges [a, b] on number_loci loci as returned by
+# ranks_to_graph.
+def graph_to_code(graph, number_loci=3):
+    space = get_genotype_space(number_loci)
+    edge_numbers = dict([[tuple(edge), e] for e, edge in enumerate(space.edges())])
+    code = 0
+    for edge in graph:
+        if edge[0] < edge[1]:
+            code |= 1 << edge_numbers[tuple(edge)]
+    return code
+
+
+# The graphs of fitness_graph.txt (on number_loci loci) are compared by their codes rather than by their lines.
+def number_of_different_graphs(number_loci=3):
     graphs_file = open("./outputs/fitness_graph.txt", "r")
     graphs_seen = set()
     outfile = open("./outputs/fitness_graph_unique.txt", "w")
     number_of_unique = 0
     for line in graphs_file:
-        if line not in graphs_seen:
+        vertices = [int(s) for s in line.replace("[", "").replace("]", "").split(', ')]
+        code = graph_to_code([vertices[i:i + 2] for i in range(0, len(vertices), 2)], number_loci)
+        if code not in graphs_seen:
             outfile.write(line)
-            graphs_seen.add(line)
+            graphs_seen.add(code)
             number_of_unique += 1
     outfile.close()
     print("The number of unique graphs is %s" % number_of_unique)
     graphs_file.close()
-    outfile.close()
     return
@@ -1,5 +1,8 @@
-from three_way_epistasis import get_next_ordering, ordering_to_fitness, epistasis
-from ranks_to_graph import ranks_to_graph
+from three_way_epistasis import EpistasisChecker
+from partial_order_interaction import total_extensions, all_total_extensions, AnalysisCache, circuit_symmetries, \
+    canonical_partial_order
+from ranks_to_graph import unique_fitness_graphs, code_to_graph
+from genotype_space import number_of_loci
 
 
 __author__ = "@gavruskin"
@@ -41,59 +44,47 @@ def edge_list_to_graph(g):
 
 # Returns a list of fitness rankings consistent with graph given by edge list:
 def consistent_rankings(graph):
-    output = []
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = ordering_to_fitness(ordering)
-    good = True
-    i = 0
-    while good and i < len(graph):
-        if fitness.index(graph[i][0]) > fitness.index(graph[i][1]):
-            good = False
-        else:
-            i += 1
-    if good:
-        output.append(fitness)
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        good = True
-        i = 0
-        while good and i < len(graph):
-            if fitness.index(graph[i][0]) > fitness.index(graph[i][1]):
-                good = False
-            else:
-                i += 1
-        if good:
-            output.append(fitness)
-    return output
+    return all_total_extensions([[edge[1], edge[0]] for edge in graph])
 
 
 # Returns whether graph has strict epistasis.
+# The consistent rankings are streamed, so that the search stops at the first one without epistasis.
 def strict_epistasis_for_graph(graph):
-    consistent_orders = consistent_rankings(graph)
-    for order in consistent_orders:
-        if not epistasis(order, positives={1, 5, 6, 7}, negatives={4, 3, 2, 8}, repetitions=[1, 1, 1, 1, 1, 1, 1, 1]):
+    checker = EpistasisChecker(positives={1, 5, 6, 7}, negatives={4, 3, 2, 8}, repetitions=[1, 1, 1, 1, 1, 1, 1, 1])
+    for order in total_extensions([[edge[1], edge[0]] for edge in graph]):
+        if True not in checker.check(order):
             return False
     return True
 
 
-def strict_epistasis():
+# Graphs that are the same up to transitive reduction and the symmetries of the cube preserving the three-way
+# interaction are tested once, the results being kept in cache (an AnalysisCache, see partial_order_interaction).
+def strict_epistasis(cache=None):
+    if cache is None:
+        cache = AnalysisCache(symmetric=True)
+    symmetries = None
+    if cache.symmetric:
+        symmetries = circuit_symmetries({1, 5, 6, 7}, {4, 3, 2, 8}, [1, 1, 1, 1, 1, 1, 1, 1])
     output = []
     ranks_file = open("./outputs/ranks.txt", "r")
-    graphs = set()
-    unique_graphs = []
+    rankings = []
     for line in ranks_file:
         line = line.replace("[", "")
         line = line.replace("]", "")
-        ranks = [int(s) for s in line.split(', ')]
-        new_graph = ranks_to_graph(ranks)
-        if not str(new_graph) in graphs:
-            graphs.add(str(new_graph))
-            unique_graphs.append(new_graph)
-            if strict_epistasis_for_graph(new_graph):
-                output.append(new_graph)
-                print(str(new_graph))  # TODO: print to file?
+        rankings.append([int(s) for s in line.split(', ')])
     ranks_file.close()
+    codes = unique_fitness_graphs(rankings)[0]
+    graphs = [code_to_graph(code, number_of_loci(len(rankings[0]))) for code in codes]
+    for new_graph in graphs:
+        partial_order = [[edge[1], edge[0]] for edge in new_graph]
+        key = repr(["strict epistasis", canonical_partial_order(partial_order, symmetries)])
+        strict = cache.get(key)
+        if strict is None:
+            strict = strict_epistasis_for_graph(new_graph)
+            cache.put(key, strict)
+        if strict:
+            output.append(new_graph)
+            print(str(new_graph))  # TODO: print to file?
     print("\nThe number of graphs that have a strict epistasis is " + str(len(output)))
     print("The number of graphs that have an epistasis is " + str(len(graphs)))
     return output
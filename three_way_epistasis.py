@@ -1,26 +1,29 @@
 import random
 import os.path
 import numpy
+from permutation_table import get_all_rankings, epistasis_masks, adjacent_transpositions
 
 __author__ = '@gavruskin'
 
 
+# Works for orderings of any length n, the last one being [n, n - 1, ..., 1] (see also genotype_space.iterate_rankings).
 def get_next_ordering(x):
     y = x
     for i in range(len(x)):
-        if x[i] < 8 - i:
+        if x[i] < len(x) - i:
             y[i] = x[i] + 1
             for j in range(i):
                 y[j] = 1
             return y
-    return [8, 7, 6, 5, 4, 3, 2, 1]
+    return list(range(len(x), 0, -1))
 
 
 # This function is for counting.
 # ordering is the order in which you choose elements from 1,...,8 to get the fitness ranking, e.g.:
 # ordering[4, 3, 1, 2, 6, 8, 5, 7] = [4, 3, 1, 1, 2, 3, 1, 1]
+# Works for orderings of any length n, choosing from 1, ..., n.
 def ordering_to_fitness(x):
-    y = [1, 2, 3, 4, 5, 6, 7, 8]
+    y = list(range(1, len(x) + 1))
     z = []
     for i in range(len(x)):
         z.append(y[x[i] - 1])
@@ -48,76 +51,172 @@ def epi_positives_get(i, w, positives, repetitions):
     return negatives_fitness_ranks[i]
 
 
+# Single-pass sign test for one circuit, precompiled from positives, negatives, and repetitions.
+# Instead of building the lists of positive and negative ranks (as epi_positives_get and epi_negatives_get do for
+# every i), walks through w once keeping the running numbers of positive and negative ranks seen so far.
+# The i-th positive rank is below the i-th negative rank for all i < len(positives) if and only if
+# min(negative count, len(positives)) <= positive count after every element of w, and symmetrically for negative.
+# Usage: checker = EpistasisChecker(positives, negatives, repetitions); checker.check(w) == [positive, negative].
+class EpistasisChecker:
+    def __init__(self, positives, negatives, repetitions):
+        # Only the first len(positives) pairs of positive and negative ranks are compared, as in the original
+        # epi_positives_get/epi_negatives_get loop, hence the prefix condition min(negative count, length) <= positive
+        # count (and symmetrically for negative interaction).
+        self.length = len(positives)
+        self.weights = {}
+        for genotype in positives:
+            self.weights[genotype] = repetitions[genotype - 1]
+        for genotype in negatives:
+            self.weights[genotype] = -repetitions[genotype - 1]
+
+    # Returns the pair of truth values [positive, negative] for fitness ranks w.
+    def check(self, w):
+        length = self.length
+        weights = self.weights
+        positive_count = 0
+        negative_count = 0
+        positive = True
+        negative = True
+        for genotype in w:
+            weight = weights.get(genotype, 0)
+            if weight > 0:
+                positive_count += weight
+                if negative and min(positive_count, length) > negative_count:
+                    negative = False
+                    if not positive:
+                        break
+            elif weight < 0:
+                negative_count -= weight
+                if positive and min(negative_count, length) > positive_count:
+                    positive = False
+                    if not negative:
+                        break
+        return [positive, negative]
+
+
+# The sign test of EpistasisChecker kept up to date along a walk through rankings by adjacent transpositions (see
+# permutation_table.adjacent_transpositions). The running numbers of positive and negative ranks are kept for every
+# prefix of w together with the numbers of prefixes that violate the positive and the negative condition. Swapping the
+# entries k and k + 1 only changes the prefix ending at k, so each swap takes O(1) time.
+# Usage: checker = IncrementalEpistasisChecker(positives, negatives, repetitions, w); checker.swap(k);
+# checker.signs() == EpistasisChecker(positives, negatives, repetitions).check(checker.w).
+class IncrementalEpistasisChecker:
+    def __init__(self, positives, negatives, repetitions, w):
+        self.length = len(positives)
+        self.w = list(w)
+        self.positive_weights = [0] * (max(self.w) + 1)
+        self.negative_weights = [0] * (max(self.w) + 1)
+        for genotype in positives:
+            self.positive_weights[genotype] = repetitions[genotype - 1]
+        for genotype in negatives:
+            self.negative_weights[genotype] = repetitions[genotype - 1]
+        self.positive_counts = []
+        self.negative_counts = []
+        positive_count = 0
+        negative_count = 0
+        for genotype in self.w:
+            positive_count += self.positive_weights[genotype]
+            negative_count += self.negative_weights[genotype]
+            self.positive_counts.append(positive_count)
+            self.negative_counts.append(negative_count)
+        self.positive_violations = 0
+        self.negative_violations = 0
+        for i in range(len(self.w)):
+            self.count_violations(i, 1)
+
+    # Adds sign times the violations of the prefix ending at i to the numbers of violations.
+    def count_violations(self, i, sign):
+        if min(self.negative_counts[i], self.length) > self.positive_counts[i]:
+            self.positive_violations += sign
+        if min(self.positive_counts[i], self.length) > self.negative_counts[i]:
+            self.negative_violations += sign
+
+    # Swaps the entries k and k + 1 of w.
+    def swap(self, k):
+        w = self.w
+        w[k], w[k + 1] = w[k + 1], w[k]
+        self.count_violations(k, -1)
+        self.positive_counts[k] = self.positive_counts[k + 1] - self.positive_weights[w[k + 1]]
+        self.negative_counts[k] = self.negative_counts[k + 1] - self.negative_weights[w[k + 1]]
+        self.count_violations(k, 1)
+
+    # Returns the pair of truth values [positive, negative] for the current w.
+    def signs(self):
+        return [self.positive_violations == 0, self.negative_violations == 0]
+
+
+# Returns a pair of truth values for positive and (then) negative epistasis implied by fitness ranks w.
+def epistasis_signs(w, positives, negatives, repetitions):
+    return EpistasisChecker(positives, negatives, repetitions).check(w)
+
+
 # Returns true if fitness ranks w imply negative epistasis.
 def epistasis_negative(w, positives, negatives, repetitions):
-    for i in range(len(positives)):  # TODO: should be max of lengths
-        if not epi_positives_get(i, w, positives, repetitions) >= epi_negatives_get(i, w, negatives, repetitions):
-            return False
-    return True
+    return epistasis_signs(w, positives, negatives, repetitions)[1]
 
 
 # Returns true if fitness ranks w imply positive epistasis.
 def epistasis_positive(w, positives, negatives, repetitions):
-    for i in range(len(positives)):  # TODO: should be max of lengths
-        if not epi_positives_get(i, w, positives, repetitions) <= epi_negatives_get(i, w, negatives, repetitions):
-            return False
-    return True
+    return epistasis_signs(w, positives, negatives, repetitions)[0]
 
 
 # Returns true if fitness ranks w imply epistasis.
 def epistasis(w, positives, negatives, repetitions):
-    if epistasis_positive(w, positives, negatives, repetitions) \
-            or epistasis_negative(w, positives, negatives, repetitions):
-        return True
-    else:
-        return False
+    epi_pos, epi_neg = epistasis_signs(w, positives, negatives, repetitions)
+    return epi_pos or epi_neg
+
+
+# Yields [w, positive, negative] for all rankings w of {1, ..., n} in the order of the adjacent transposition walk
+# (permutation_table.adjacent_transpositions), the signs being updated by IncrementalEpistasisChecker after every swap.
+# w is the same list, changed in place by the walk: copy it to keep it.
+def walk_epistasis_signs(positives, negatives, repetitions, n=8):
+    checker = IncrementalEpistasisChecker(positives, negatives, repetitions, range(1, n + 1))
+    yield [checker.w] + checker.signs()
+    for k in adjacent_transpositions(n):
+        checker.swap(k)
+        yield [checker.w] + checker.signs()
+
+
+# Returns the list of [ranking, positive, negative] of all rankings of {1, ..., n} that imply epistasis for the given
+# circuit, computed from the table of all rankings (permutation_table) in the order of get_next_ordering if
+# method == "table", or by walk_epistasis_signs in the order of the walk if method == "walk". The walk needs no table,
+# which makes it suitable for larger n.
+def epistasis_rankings(positives, negatives, repetitions, n=8, method="table"):
+    if method == "walk":
+        return [[list(w), epi_pos, epi_neg] for w, epi_pos, epi_neg in
+                walk_epistasis_signs(positives, negatives, repetitions, n) if epi_pos or epi_neg]
+    rankings = get_all_rankings(n)
+    epi_pos, epi_neg = epistasis_masks(rankings, positives, negatives, repetitions)
+    epi = epi_pos | epi_neg
+    return [list(row) for row in zip(rankings[epi].tolist(), epi_pos[epi].tolist(), epi_neg[epi].tolist())]
 
 
 # Generates a file with the list of all rankings that imply epistasis for the given circuit.
 # circuit name is the part of the file name as below.
-def list_epistasis(positives, negatives, circuit_name, repetitions):
+# The rankings are taken from the table of all rankings (permutation_table) in the order of get_next_ordering, or from
+# the adjacent transposition walk in its order if method == "walk" (see epistasis_rankings).
+def list_epistasis(positives, negatives, circuit_name, repetitions, method="table", n=8):
+    epi_rankings = [ranking for ranking, epi_pos, epi_neg in
+                    epistasis_rankings(positives, negatives, repetitions, n, method)]
     epi_ranks_file = open("./outputs/circuit_%s_orders.txt" % circuit_name, "w")
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = [1, 2, 3, 4, 5, 6, 7, 8]
-    number = 0
-    if epistasis(fitness, positives, negatives, repetitions):
-        number += 1
-        epi_ranks_file.write(str(fitness) + "\n")
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        if epistasis(fitness, positives, negatives, repetitions):
-            number += 1
-            epi_ranks_file.write(str(fitness) + "\n")
+    epi_ranks_file.write("".join([str(fitness) + "\n" for fitness in epi_rankings]))
     epi_ranks_file.close()
+    number = len(epi_rankings)
     print("The total number of circuit %s epistases is " % circuit_name + str(number) +
           ". Their complete list has been written to circuit_%s_orders.txt" % circuit_name)
 
 
 # Generates a file with the list of all rankings (followed by the sign) that imply epistasis for the given circuit.
 # circuit name is the part of the file name as below.
-def list_epistasis_signed(positives, negatives, circuit_name, repetitions):
+# method and n are as in list_epistasis.
+def list_epistasis_signed(positives, negatives, circuit_name, repetitions, method="table", n=8):
+    epi_rankings = epistasis_rankings(positives, negatives, repetitions, n, method)
     epi_ranks_file = open("./outputs/circuit_%s_orders_signed.txt" % circuit_name, "w")
-    ordering = [1, 1, 1, 1, 1, 1, 1, 1]
-    fitness = [1, 2, 3, 4, 5, 6, 7, 8]
-    number_positive = 0
-    number_negative = 0
-    if epistasis_positive(fitness, positives, negatives, repetitions):
-        number_positive += 1
-        epi_ranks_file.write(str(fitness) + " +" + "\n")
-    elif epistasis_negative(fitness, positives, negatives, repetitions):
-        number_negative += 1
-        epi_ranks_file.write(str(fitness) + " -" + "\n")
-    while ordering != [8, 7, 6, 5, 4, 3, 2, 1]:
-        ordering = get_next_ordering(ordering)
-        fitness = ordering_to_fitness(ordering)
-        if epistasis_positive(fitness, positives, negatives, repetitions):
-            number_positive += 1
-            epi_ranks_file.write(str(fitness) + " +" + "\n")
-        elif epistasis_negative(fitness, positives, negatives, repetitions):
-            number_negative += 1
-            epi_ranks_file.write(str(fitness) + " -" + "\n")
+    epi_ranks_file.write("".join([str(ranking) + (" +" if epi_pos else " -") + "\n"
+                                  for ranking, epi_pos, epi_neg in epi_rankings]))
     epi_ranks_file.close()
+    number_positive = len([ranking for ranking, epi_pos, epi_neg in epi_rankings if epi_pos])
+    number_negative = len(epi_rankings) - number_positive
     print("The total number of circuit %s positive epistases is " % circuit_name + str(number_positive) + ".")
     print("The total number of circuit %s negative epistases is " % circuit_name + str(number_negative) + ".")
     print("Their complete list has been written to circuit_%s_orders.txt" % circuit_name)
@@ -135,9 +234,8 @@ def check_for_epistasis(v, details=False):
     w = []
     for i in range(len(v)):
         w.append(v.index(v_sorted[i]) + 1)
-    epi_pos = epistasis_positive(w, positives, negatives, repetitions)
-    epi_neg = epistasis_negative(w, positives, negatives, repetitions)
-    output = [epi_pos, epi_neg]
+    output = epistasis_signs(w, positives, negatives, repetitions)
+    epi_pos, epi_neg = output
     if details:
         epi = epi_neg or epi_pos
         print(numpy.round(v, 3))
@@ -150,16 +248,18 @@ def check_for_epistasis(v, details=False):
 
 
 # Given a ranking as in the comment above, returns a tuple of fitness values that induce that ranking.
+# Works for rankings of any length.
 def ranks_to_values(fitness):
-    output = [0, 0, 0, 0, 0, 0, 0, 0]
+    output = [0] * len(fitness)
     for i in range(len(fitness)):
         output[fitness[i] - 1] = i + 1
     return output
 
 
-def get_random_fitness_values():
+# Returns n (by default, 8 = 2^3 genotypes) sorted random fitness values.
+def get_random_fitness_values(n=8):
     z = []
-    for i in range(8):
+    for i in range(n):
         z.append(random.uniform(0, 1))
     return sorted(z)
 
@@ -1,22 +1,18 @@
-from three_way_epistasis import epistasis_positive, epistasis_negative
+from three_way_epistasis import epistasis_signs
 from four_way_interactions import get_geno_number
+from genotype_space import get_genotype_space, number_of_loci
 
 __author__ = '@gavruskin'
 
 
+# Returns a pair of truth values for positive and (then) negative total n-way interaction derived from ranking w of
+# all 2^n genotypes, given in binary format (e.g. [0, 1, 10, 11] for n = 2) and enumerated as in four_way_interactions.
 def total_n_way_interaction(w):
     w = [get_geno_number(i) for i in w]
     n = len(w)
+    if number_of_loci(n) is None:
+        print("total_n_way_interaction received a ranking of length %s, which is not a power of two." % n)
+        return
     repetitions = [1] * n
-    positives = set()
-    negatives = set()
-    for genotype in w:
-        genotype = bin(genotype - 1)
-        number_ones = genotype[2:].count("1")
-        if number_ones % 2 == 0:
-            positives.add(get_geno_number(genotype))
-        else:
-            negatives.add(get_geno_number(genotype))
-    output = [epistasis_positive(w, positives, negatives, repetitions),
-              epistasis_negative(w, positives, negatives, repetitions)]
-    return output
+    positives, negatives = get_genotype_space(number_of_loci(n), "binary").total_interaction()
+    return epistasis_signs(w, positives, negatives, repetitions)
@@ -1,33 +1,22 @@
-import pandas as pd
 from models_wilcoxon import rank_sum_n_sites
 import networkx as nx
 import pylab as plt
+from fitness_landscape import landscape_from_csv
 from conditional_and_marginal_epistasis import genotype_look_good,\
     marginal_two_way_interaction_analysis, marginal_three_way_interaction_analysis,\
-    conditional_two_way_interaction_analysis
+    conditional_two_way_interaction_analysis, conditional_three_way_interaction_analysis
 
 
 __author__ = '@gavruskin'
 
 
-# First row must contain names of columns, first column---genotypes.
-# Returns a dictionary with all trial values, e.g.
-# datafile_fly_bacteria_process("fly_bacteria_data.csv")["100"] is a list of fitness values
-# obtained in all trials for genotype 0...0100.
-# Important that preceding 0's must be dropped in the call, e.g. the wild-type should be called as "0".
-def datafile_fly_bacteria_process(data_file):
-    values = pd.read_csv(data_file)
-    landscapes = {}
-    for ind in range(len(values.iloc[:, 0])):
-        landscapes[str(values.iloc[ind, 0])] = values.iloc[ind, 1:]
-    return landscapes
-
-
-data = datafile_fly_bacteria_process("fly_bacteria_data_new.csv")
+# First row must contain names of columns, first column---genotypes (see fitness_landscape.landscape_from_csv).
+data = landscape_from_csv("fly_bacteria_data_new.csv")
 
 marginal_two_way_interaction_analysis(data)
 marginal_three_way_interaction_analysis(data)
 conditional_two_way_interaction_analysis(data)
+conditional_three_way_interaction_analysis(data)
 
 # genotypes_with_means = rank_sum_n_sites(data, True)
 # genotypes = rank_sum_n_sites(data)
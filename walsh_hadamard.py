@@ -0,0 +1,134 @@
+import itertools
+import numpy as np
+from fitness_landscape import FitnessLandscape, landscape_from_dict
+
+__author__ = "@gavruskin"
+
+
+# Interaction coordinates of fitness landscapes through the fast Walsh-Hadamard transform.
+# A landscape on n loci is an array whose axis (by default the last one) has length 2^n and is indexed by the bit
+# patterns of the genotypes, locus 1 being the leftmost (most significant) bit, as in genotype_space.
+# The interaction coordinate u_S of the set of loci S (given by its bit pattern, e.g. S = 0b111 for u_111) is
+# u_S = \sum_g (-1)^{|g & S|} w_g, that is, the genotypes that share an even number of mutations with S get sign +.
+# The transform computes all 2^n coordinates in n * 2^n additions (instead of 4^n), for all trials at once.
+# Example of usage: interaction_coordinates(data)[trial, int("011", 2)] is u_011 in the trial.
+
+
+# Returns the number of loci n of an axis of length 2^n.
+def axis_loci(length):
+    n = length.bit_length() - 1
+    if length != 2 ** n:
+        raise ValueError("The length %s of the landscape axis is not a power of two." % length)
+    return n
+
+
+# Returns the Walsh-Hadamard transform of values along axis, i.e. all interaction coordinates u_S.
+# If loci is given (a list of loci numbered from 0 for the leftmost locus), only those loci are transformed, which
+# gives the interaction coordinates of the loci conditioned on the genotype at the other loci.
+def walsh_hadamard_transform(values, axis=-1, loci=None):
+    values = np.array(np.moveaxis(np.asarray(values, dtype=float), axis, -1), order="C")  # A copy.
+    shape = values.shape
+    n = axis_loci(shape[-1])
+    if loci is None:
+        loci = range(n)
+    for locus in loci:
+        block = 2 ** (n - 1 - locus)  # Genotypes g and g ^ block differ at locus.
+        pairs = values.reshape(shape[:-1] + (shape[-1] // (2 * block), 2, block))
+        without = pairs[..., 0, :].copy()
+        pairs[..., 0, :] += pairs[..., 1, :]
+        pairs[..., 1, :] *= -1
+        pairs[..., 1, :] += without
+    return np.moveaxis(values, -1, axis)
+
+
+# Returns the (number_trials, 2^n) masked array of fitness values of data, a FitnessLandscape or a dictionary as in
+# fitness_landscape.landscape_from_dict (which is not modified), the missing measurements being masked.
+# Underneath the mask, missing measurements are 0.
+def data_to_array(data):
+    landscape = landscape_from_dict(data)
+    return np.ma.masked_array(np.where(landscape.missing, 0, landscape.values).T, landscape.missing.T)
+
+
+# Returns the (number_trials, 2^n) masked array of all interaction coordinates of data (a FitnessLandscape, a dictionary
+# as in data_to_array, or a possibly masked (number_trials, 2^n) array), coordinates[trial, S] being u_S in the trial.
+# Every coordinate involves all genotypes, so the coordinates of a trial are masked if any measurement of the trial is
+# missing; effective_sample_sizes gives the numbers of trials left.
+def interaction_coordinates(data):
+    if isinstance(data, (dict, FitnessLandscape)):
+        data = data_to_array(data)
+    missing = np.ma.getmaskarray(data)
+    coordinates = walsh_hadamard_transform(np.ma.filled(data, 0))
+    return np.ma.masked_array(coordinates, np.broadcast_to(missing.any(axis=-1, keepdims=True), coordinates.shape))
+
+
+# Returns the numbers of available (unmasked) trials of every coordinate of coordinates, a masked array with trials
+# along the first axis, e.g. the output of interaction_coordinates, marginal_interactions, or conditional_interactions.
+def effective_sample_sizes(coordinates):
+    return np.ma.count(coordinates, axis=0)
+
+
+# Returns the bit pattern of the set of loci (numbered from 0 for the leftmost locus) on n loci.
+def loci_to_pattern(loci, n):
+    pattern = 0
+    for locus in loci:
+        pattern |= 1 << (n - 1 - locus)
+    return pattern
+
+
+# Returns the (number_trials, n, ..., n) masked array (with order axes of length n) with entry
+# [trial, i_1, ..., i_order], i_1 < ... < i_order, being the marginal interaction u_S of loci S = {i_1, ..., i_order},
+# sliced from coordinates (as returned by interaction_coordinates). The other entries are masked.
+def marginal_interactions(coordinates, order):
+    n = axis_loci(coordinates.shape[-1])
+    output = np.ma.masked_all((coordinates.shape[0],) + (n,) * order, dtype=float)
+    for loci in itertools.combinations(range(n), order):
+        output[(slice(None),) + loci] = coordinates[:, loci_to_pattern(loci, n)]
+    return output
+
+
+# Returns the (number_trials, n, n) masked array of the marginal two-way interactions, entry [trial, i, j], i < j,
+# being u_S of loci i and j (S = {i, j}), as in marginal_interactions.
+def marginal_two_way(coordinates):
+    return marginal_interactions(coordinates, 2)
+
+
+# Returns the (number_trials, n, n, n) masked array of the marginal three-way interactions, as in marginal_two_way.
+def marginal_three_way(coordinates):
+    return marginal_interactions(coordinates, 3)
+
+
+# Returns the (number_trials, n, ..., n, 2^(n - order)) masked array (with order axes of length n) with entry
+# [trial, i_1, ..., i_order, k], i_1 < ... < i_order, being the order-way interaction of loci i_1, ..., i_order
+# conditioned on the genotype with bit pattern k at the other n - order loci (in their order).
+# For every set of loci, the loci are moved to trailing axes of the (number_trials, 2, ..., 2) fitness tensor, so that
+# the interactions for all backgrounds are one contraction with the signs (-1)^{|g|} of the 2^order subcube genotypes g,
+# e.g. w_00 - w_01 - w_10 + w_11 for order 2.
+# values is the possibly masked (number_trials, 2^n) array of fitness values (e.g. the output of data_to_array).
+# An entry is masked if a measurement of its subcube is missing in the trial, and so the interaction of every subcube
+# uses all trials in which its 2^order genotypes are measured. The other entries (e.g. i_1 >= i_2) are masked too.
+def conditional_interactions(values, order):
+    n = axis_loci(values.shape[-1])
+    number_trials = values.shape[0]
+    tensor = np.ma.filled(values, 0).reshape((number_trials,) + (2,) * n)
+    missing = np.ma.getmaskarray(values).reshape((number_trials,) + (2,) * n)
+    signs = np.array([(-1) ** bin(g).count("1") for g in range(2 ** order)], dtype=float)
+    output = np.ma.masked_all((number_trials,) + (n,) * order + (2 ** (n - order),), dtype=float)
+    for loci in itertools.combinations(range(n), order):
+        trailing = range(n + 1 - order, n + 1)
+        axes = [locus + 1 for locus in loci]
+        subcubes = np.moveaxis(tensor, axes, trailing).reshape(number_trials, 2 ** (n - order), 2 ** order)
+        subcubes_missing = np.moveaxis(missing, axes, trailing).reshape(number_trials, 2 ** (n - order), 2 ** order)
+        output[(slice(None),) + loci] = np.ma.masked_array(subcubes @ signs, subcubes_missing.any(axis=-1))
+    return output
+
+
+# Returns the (number_trials, n, n, 2^(n - 2)) masked array of the conditional two-way interactions, entry
+# [trial, i, j, k] being the interaction of loci i and j conditioned on the genotype k at the other loci, as in
+# conditional_interactions.
+def conditional_two_way(values):
+    return conditional_interactions(values, 2)
+
+
+# Returns the (number_trials, n, n, n, 2^(n - 3)) masked array of the conditional three-way interactions.
+def conditional_three_way(values):
+    return conditional_interactions(values, 3)